@@ -0,0 +1,85 @@
+"""
+Benchmarks the loaders of the already stored dates on a synthetic output tree.
+
+Usage: python benchmarks/load_dates.py [--instruments 500] [--years 20]
+"""
+import argparse
+import datetime
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# pylint: disable=wrong-import-position
+from price_scraper.util import iter_stored_dates, last_stored_date
+
+
+def generate_tree(directory, instruments, years):
+    """
+    Generates price files in the same format as the price exporter pipeline
+    """
+    start_date = datetime.date.today() - datetime.timedelta(days=365 * years)
+    for idx in range(instruments):
+        rows = []
+        for day in range(365 * years):
+            date = start_date + datetime.timedelta(days=day)
+            rows.append(json.dumps({"price": 1 + day / 10000, "date": date.isoformat()}, indent=1))
+        content = "[\n" + ",\n".join(rows) + "\n]"
+        (directory / f"instrument_{idx}.json").write_text(content, encoding="utf-8")
+
+
+def json_loader(file_path):
+    """
+    The loader used before the streaming scanner
+    """
+    with file_path.open("rb") as f:
+        return {elem["date"] for elem in json.load(f)}
+
+
+def streaming_loader(file_path):
+    """
+    Collects the dates with the streaming scanner
+    """
+    return set(iter_stored_dates(file_path))
+
+
+def measure(name, loader, files):
+    """
+    Runs the loader on every file and reports time and the peak memory
+    of loading a single file
+    """
+    start = time.perf_counter()
+    for file_path in files:
+        loader(file_path)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    loader(files[0])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<10} {elapsed:8.2f} s {peak / 1024 / 1024:10.2f} MiB peak")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--instruments", type=int, default=500)
+    parser.add_argument("--years", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        directory = Path(tmp_dir)
+        generate_tree(directory, args.instruments, args.years)
+        files = sorted(directory.glob("*.json"))
+        size = sum(f.stat().st_size for f in files) / 1024 / 1024
+        print(f"{len(files)} files, {size:.1f} MiB")
+        measure("json.load", json_loader, files)
+        measure("streaming", streaming_loader, files)
+        measure("last date", last_stored_date, files)
+
+
+if __name__ == "__main__":
+    main()
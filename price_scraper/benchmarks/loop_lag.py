@@ -0,0 +1,152 @@
+"""
+Measures how long the reactor is stalled by the price exporter pipeline with
+`ASYNC_OUTPUT_ENABLED` while the background writer works through a slow disk.
+
+Every instrument has a stored history, so its dates are loaded when its first
+item arrives. A timer records the delay of its calls during the run.
+
+Usage: python benchmarks/loop_lag.py [--instruments 200] [--days 50] [--write-delay 2] [--queue-size 500]
+                                   [--backend json]
+"""
+import argparse
+import datetime
+import logging
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from scrapy.settings import Settings
+from scrapy.utils.defer import parallel
+from twisted.internet import reactor, task
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# pylint: disable=wrong-import-position
+from price_scraper import settings as project_settings
+from price_scraper.items import PortfolioPerformanceHistoricalPrice
+from price_scraper.price_exporter_pipeline import PriceExporterPipeline
+
+TICK = 0.005
+
+
+class Spider:
+    """
+    The attributes of a spider used by the pipeline
+    """
+    name = "lag"
+    logger = logging.getLogger("lag")
+
+    def __init__(self, base_dir, settings):
+        self.base_dir = base_dir
+        self.settings = settings
+
+
+def generate_items(instruments, start, days):
+    """
+    Generates the prices of the instruments one instrument after the other
+    """
+    return [
+        PortfolioPerformanceHistoricalPrice(
+            file_name=f"Portfolio {idx}",
+            date=(start + datetime.timedelta(days=day)).isoformat(),
+            price=1 + day / 7919,
+            security_name=f"Portfolio {idx}",
+            currency="HUF",
+            ticker_symbol=f"PORTFOLIO_{idx}",
+        )
+        for idx in range(instruments)
+        for day in range(days)
+    ]
+
+
+def slow(func, delay):
+    """
+    Delays every call of a storage method like a slow disk
+    """
+    def call(*args):
+        time.sleep(delay)
+        return func(*args)
+    return call
+
+
+def run_pipeline(settings, base_dir, items, delay):
+    """
+    Processes the items like the engine and returns the delays of the timer calls
+    """
+    pipeline = PriceExporterPipeline(settings)
+    spider = Spider(base_dir, settings)
+    pipeline.open_spider(spider)
+    pipeline.storage.store = slow(pipeline.storage.store, delay)
+    lags = []
+    last = [time.perf_counter()]
+
+    def tick():
+        now = time.perf_counter()
+        lags.append(now - last[0] - TICK)
+        last[0] = now
+
+    timer = task.LoopingCall(tick)
+    timer.start(TICK, now=False)
+    done = parallel(items, settings.getint("CONCURRENT_ITEMS"), pipeline.process_item, spider)
+
+    def finish(result):
+        timer.stop()
+        pipeline.close_spider(spider)
+        reactor.stop()
+        return result
+
+    done.addBoth(finish)
+    reactor.run()
+    return lags
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--instruments", type=int, default=200)
+    parser.add_argument("--days", type=int, default=50)
+    parser.add_argument("--history", type=int, default=500, help="stored days per instrument")
+    parser.add_argument("--write-delay", type=float, default=2, help="ms per stored price")
+    parser.add_argument("--queue-size", type=int, default=500)
+    parser.add_argument("--backend", default="json", choices=("json", "sqlite"))
+    args = parser.parse_args()
+
+    start = datetime.date(2008, 1, 1)
+    base_dir = tempfile.mkdtemp()
+    try:
+        settings = Settings()
+        settings.setmodule(project_settings)
+        settings.set("PRICE_STORAGE_BACKEND", args.backend)
+        settings.set("PRICE_STORAGE_SQLITE_PATH", f"{base_dir}/db/prices.sqlite")
+        # the stored history, written without the writer thread and the delay
+        history = generate_items(args.instruments, start, args.history)
+        pipeline = PriceExporterPipeline(settings)
+        spider = Spider(base_dir, settings)
+        pipeline.open_spider(spider)
+        for item in history:
+            pipeline.process_item(item, spider)
+        pipeline.close_spider(spider)
+
+        settings.set("ASYNC_OUTPUT_ENABLED", True)
+        settings.set("ASYNC_OUTPUT_QUEUE_SIZE", args.queue_size)
+        items = generate_items(args.instruments, start + datetime.timedelta(days=args.history), args.days)
+        began = time.perf_counter()
+        lags = sorted(run_pipeline(settings, base_dir, items, args.write_delay / 1000))
+        elapsed = time.perf_counter() - began
+        print(f"{len(items)} prices of {args.instruments} instruments, {args.write_delay} ms per write, "
+              f"{args.backend} storage")
+        print(f"run: {elapsed:.1f} s, timer calls: {len(lags)}")
+        if not lags:
+            # the run finished before the first timer call
+            print("reactor lag: no samples")
+            return
+        print(f"reactor lag max: {lags[-1] * 1000:.1f} ms, "
+              f"p99: {lags[int(len(lags) * 0.99)] * 1000:.1f} ms, "
+              f"median: {lags[len(lags) // 2] * 1000:.1f} ms")
+    finally:
+        shutil.rmtree(base_dir)
+
+
+if __name__ == "__main__":
+    main()
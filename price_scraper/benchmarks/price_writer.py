@@ -0,0 +1,66 @@
+"""
+Compares the throughput of the price row exporters for a backfill.
+
+Usage: python benchmarks/price_writer.py [--rows 1000000]
+"""
+import argparse
+import datetime
+import io
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# pylint: disable=wrong-import-position
+from price_scraper.items import PortfolioPerformanceHistoricalPrice
+from price_scraper.price_exporter_pipeline import create_exporter
+
+
+def generate_items(count):
+    """
+    Generates items like the ones yielded by the spiders
+    """
+    start_date = datetime.date(2008, 1, 1)
+    return [
+        PortfolioPerformanceHistoricalPrice(
+            file_name="Klasszikus",
+            date=(start_date + datetime.timedelta(days=idx)).isoformat(),
+            price=1 + idx / 7919,
+            security_name="OTP Önkéntes Nyugdíjpénztári Klasszikus portfólió",
+            currency="HUF",
+            ticker_symbol="OTPNY_KLASS",
+        )
+        for idx in range(count)
+    ]
+
+
+def export(writer, items, rows):
+    """
+    Exports `rows` rows by cycling over the items and returns the output and the elapsed time
+    """
+    buffer = io.BytesIO()
+    exporter = create_exporter(buffer, writer)
+    start = time.perf_counter()
+    exporter.start_exporting()
+    for idx in range(rows):
+        exporter.export_item(items[idx % len(items)])
+    exporter.finish_exporting()
+    return buffer.getvalue(), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    items = generate_items(10_000)
+    outputs = {}
+    for writer in ("scrapy", "fast"):
+        outputs[writer], elapsed = export(writer, items, args.rows)
+        print(f"{writer:<8} {elapsed:8.2f} s {args.rows / elapsed:12.0f} items/s")
+    print(f"identical output: {outputs['scrapy'] == outputs['fast']}")
+
+
+if __name__ == "__main__":
+    main()
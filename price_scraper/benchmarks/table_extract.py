@@ -0,0 +1,84 @@
+"""
+Compares the per cell selectors with the single pass table extraction on an
+Allianz-like historical page (one row per day since 2008).
+
+Usage: python benchmarks/table_extract.py [--days 6000] [--portfolios 8] [--repeat 5]
+"""
+import argparse
+import datetime
+import sys
+import time
+from pathlib import Path
+
+from scrapy.http import HtmlResponse
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# pylint: disable=wrong-import-position
+from price_scraper.tables import extract_table
+
+
+def generate_page(days, portfolios):
+    """
+    Generates a page with the layout of the Allianz price table
+    """
+    start_date = datetime.date(2008, 1, 1)
+    header = "".join(f"<td>Portfolio {idx} név</td>" for idx in range(portfolios))
+    rows = [
+        f"<tr><td>{(start_date + datetime.timedelta(days=day)).strftime('%Y.%m.%d')}</td><td>\xa0</td>"
+        + "".join(f"<td>{1 + (day * 31 + idx) % 7919 / 1000:.4f}".replace('.', ',') + "</td>"
+                  for idx in range(portfolios))
+        + "</tr>"
+        for day in range(days)
+    ]
+    html = ("<html><body><table>" + "<tr><td>title</td></tr>" * 4
+            + f"<tr><td>Dátum</td><td>\xa0</td>{header}</tr>" + "".join(rows)
+            + "</table></body></html>")
+    return html.encode("utf-8")
+
+
+def selectors(response):
+    """
+    The former extraction with a Selector per row and cell
+    """
+    table = response.css('tr')
+    portfolios = [r.css('::text').get() for r in table[4].css('td')]
+    portfolios = [c for c in portfolios if c and c != '\xa0']
+    rows = []
+    for row in table[5:]:
+        row_datas = [r.css('::text').get() for r in row.css('td')]
+        rows.append([c for c in row_datas if c and c != '\xa0'])
+    return portfolios, rows
+
+
+def single_pass(response):
+    """
+    The extraction with the tables utility
+    """
+    return extract_table(response, 'tr', header_row=4, drop_empty=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=6000)
+    parser.add_argument("--portfolios", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    body = generate_page(args.days, args.portfolios)
+    print(f"page: {len(body) / 1024 / 1024:.1f} MiB, {args.days} rows x {args.portfolios} portfolios")
+    results = {}
+    for name, extract in (("selectors", selectors), ("single pass", single_pass)):
+        elapsed = 0
+        for _ in range(args.repeat):
+            # a new response every time, so the parsing of the document is measured as well
+            response = HtmlResponse("https://penztar.allianz.hu/", body=body, encoding="utf-8")
+            start = time.perf_counter()
+            results[name] = extract(response)
+            elapsed += time.perf_counter() - start
+        print(f"{name:<12} {elapsed / args.repeat * 1000:8.1f} ms per page")
+    print(f"identical output: {results['selectors'] == results['single pass']}")
+
+
+if __name__ == "__main__":
+    main()
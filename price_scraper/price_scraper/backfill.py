@@ -0,0 +1,149 @@
+import datetime
+
+from .util import spider_state_path
+
+
+def date_chunks(start_date, end_date, chunk_days):
+    """
+    Splits the inclusive date range into consecutive `(start, end)` chunks
+    of at most `chunk_days` days
+    """
+    chunk = datetime.timedelta(days=chunk_days)
+    while start_date <= end_date:
+        chunk_end = min(start_date + chunk - datetime.timedelta(days=1), end_date)
+        yield start_date, chunk_end
+        start_date = chunk_end + datetime.timedelta(days=1)
+
+
+def iter_dates(start_date, end_date):
+    """
+    Yields every date of the inclusive range
+    """
+    while start_date <= end_date:
+        yield start_date
+        start_date = start_date + datetime.timedelta(days=1)
+
+
+class BackfillCheckpoint:
+    """
+    Completed `(date, report_name)` pairs of a backfill which survive between runs.
+
+    Completed pairs are kept in memory until `commit` appends them to a text file
+    one per line. It is called once their prices are on disk, so an interrupted
+    run loses at most the pairs which were not committed yet.
+    """
+
+    def __init__(self, directory, spider):
+        self.path = spider_state_path(directory, spider, ".txt")
+        self.done = set()
+        if self.path.exists():
+            with self.path.open(encoding="utf-8") as f:
+                for line in f:
+                    # a line cut by a crash does not match any pair
+                    date, _, report_name = line.rstrip("\n").partition(" ")
+                    self.done.add((date, report_name))
+        self.pending = []
+        self.file = self.path.open("a", encoding="utf-8")
+
+    def __contains__(self, pair):
+        date, report_name = pair
+        return (date.isoformat(), report_name) in self.done
+
+    def __len__(self):
+        return len(self.done)
+
+    def add(self, date, report_name):
+        """
+        Records a completed pair, it is written to the file by the next commit
+        """
+        self.done.add((date.isoformat(), report_name))
+        self.pending.append(f"{date.isoformat()} {report_name}\n")
+
+    def commit(self):
+        """
+        Writes the pairs completed since the last commit
+        """
+        if not self.pending:
+            return
+        self.file.writelines(self.pending)
+        self.file.flush()
+        self.pending = []
+
+    def close(self):
+        """
+        Closes the file, the uncommitted pairs are requested again by the next run
+        """
+        self.file.close()
+
+
+class PendingReports:
+    """
+    Reports whose items are still in the item pipelines, keyed by response.
+
+    A report is added to the checkpoint once its callback finished and each of its
+    items was scraped or dropped. A report with a failed item is not added, so it
+    is requested again by the next run.
+    """
+
+    def __init__(self, checkpoint):
+        self.checkpoint = checkpoint
+        # response => [items in the pipelines, (date, report_name) when parsed, failed]
+        self.reports = {}
+
+    def item_started(self, response):
+        """
+        Called for every item yielded from the response
+        """
+        self.reports.setdefault(response, [0, None, False])[0] += 1
+
+    def parsed(self, response, date, report_name):
+        """
+        Called when the callback of the response yielded every item
+        """
+        report = self.reports.setdefault(response, [0, None, False])
+        report[1] = (date, report_name)
+        self._finish(response, report)
+
+    def item_finished(self, response):
+        """
+        Handler of the item_scraped and item_dropped signals
+        """
+        report = self.reports.get(response)
+        if report is not None:
+            report[0] -= 1
+            self._finish(response, report)
+
+    def item_failed(self, response):
+        """
+        Handler of the item_error signal
+        """
+        report = self.reports.get(response)
+        if report is not None:
+            report[2] = True
+            self.item_finished(response)
+
+    def _finish(self, response, report):
+        items, pair, failed = report
+        if items or pair is None:
+            return
+        del self.reports[response]
+        if not failed:
+            self.checkpoint.add(*pair)
+
+
+def backfill_plan(spider, checkpoint, start_date, end_date, report_names, chunk_days, dates=iter_dates):
+    """
+    Yields the `(date, report_name)` pairs of the date range which are not
+    in the checkpoint, chunk by chunk. `dates(start, end)` enumerates the
+    requested dates of a chunk.
+    """
+    for chunk_start, chunk_end in date_chunks(start_date, end_date, chunk_days):
+        pairs = [
+            (date, report_name)
+            for date in dates(chunk_start, chunk_end)
+            for report_name in report_names
+        ]
+        pending = [pair for pair in pairs if pair not in checkpoint]
+        spider.logger.info("Backfill %s - %s: %d of %d reports pending",
+            chunk_start, chunk_end, len(pending), len(pairs))
+        yield from pending
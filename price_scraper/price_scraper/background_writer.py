@@ -0,0 +1,137 @@
+import logging
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from twisted.internet.defer import Deferred
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundWriter:
+    """
+    Runs the file output of a pipeline on a dedicated thread, so disk latency
+    does not stall the reactor.
+
+    Tasks are executed in submission order from a bounded queue. When the queue
+    is full `submit` returns a Deferred which fires once the task is queued,
+    so the pipeline applies backpressure to the engine instead of blocking it.
+    `defer` queues a task the same way and returns a Deferred of its result.
+    `submit` and `defer` must be called from the reactor thread.
+    """
+
+    def __init__(self, name, max_queue_size, stats=None):
+        # pylint: disable=import-outside-toplevel
+        # the reactor must not be installed when this module is imported
+        from twisted.internet import reactor
+        self.reactor = reactor
+        self.queue = queue.Queue(max_queue_size)
+        self.waiting = deque()
+        self.stats = stats
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, func, *args):
+        """
+        Queues a task. Returns None if it was queued immediately, otherwise
+        a Deferred which fires when it is queued.
+        """
+        self._raise_error()
+        return self._put((func, args, None))
+
+    def defer(self, func, *args):
+        """
+        Queues a task without blocking and returns a Deferred which fires on the
+        reactor thread with its result after every previously queued task
+        """
+        self._raise_error()
+        deferred = Deferred()
+        future = Future()
+        future.add_done_callback(lambda done: self.reactor.callFromThread(_fire, deferred, done))
+        self._put((func, args, future))
+        return deferred
+
+    def call(self, func, *args):
+        """
+        Runs a task on the writer thread after every queued task and returns its result.
+        It blocks the calling thread, the reactor should only use it when closing.
+        """
+        self._raise_error()
+        future = Future()
+        self.queue.put((func, args, future))
+        return future.result()
+
+    def close(self):
+        """
+        Waits until every queued task is done and stops the thread
+        """
+        self.queue.put(None)
+        self.thread.join()
+        self._raise_error()
+
+    def _put(self, task):
+        """
+        Queues a task or appends it to the waiting tasks when the queue is full
+        """
+        if not self.waiting:
+            try:
+                self.queue.put_nowait(task)
+                return None
+            except queue.Full:
+                pass
+        if self.stats is not None:
+            self.stats.inc_value("background_writer/backpressure")
+        deferred = Deferred()
+        self.waiting.append((task, deferred))
+        return deferred
+
+    def _release_waiting(self):
+        """
+        Queues the waiting tasks while there is space, runs on the reactor thread
+        """
+        while self.waiting:
+            task, deferred = self.waiting[0]
+            try:
+                self.queue.put_nowait(task)
+            except queue.Full:
+                return
+            self.waiting.popleft()
+            deferred.callback(None)
+
+    def _run(self):
+        while True:
+            task = self.queue.get()
+            if self.waiting:
+                self.reactor.callFromThread(self._release_waiting)
+            if task is None:
+                return
+            func, args, future = task
+            try:
+                result = func(*args)
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                if future is not None:
+                    future.set_exception(error)
+                    continue
+                logger.exception("Background write failed")
+                if self.error is None:
+                    self.error = error
+            else:
+                if future is not None:
+                    future.set_result(result)
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+
+def _fire(deferred, future):
+    """
+    Passes the outcome of a finished task to its Deferred
+    """
+    error = future.exception()
+    if error is not None:
+        deferred.errback(error)
+    else:
+        deferred.callback(future.result())
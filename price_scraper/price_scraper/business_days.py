@@ -0,0 +1,95 @@
+"""
+Hungarian business day calendar
+"""
+import datetime
+
+# (month, day) of the public holidays with a fixed date
+FIXED_HOLIDAYS = [
+    (1, 1),
+    (3, 15),
+    (5, 1),
+    (8, 20),
+    (10, 23),
+    (11, 1),
+    (12, 25),
+    (12, 26),
+]
+
+# Rest days and working Saturdays of the yearly working day swaps.
+# They are published in a decree every year and have to be added here by hand.
+DAY_SWAPS = {
+    2022: {
+        "rest": [datetime.date(2022, 3, 14), datetime.date(2022, 10, 31)],
+        "work": [datetime.date(2022, 3, 26), datetime.date(2022, 10, 15)],
+    },
+    2024: {
+        "rest": [datetime.date(2024, 8, 19), datetime.date(2024, 12, 24), datetime.date(2024, 12, 27)],
+        "work": [datetime.date(2024, 8, 3), datetime.date(2024, 12, 7), datetime.date(2024, 12, 14)],
+    },
+    2025: {
+        "rest": [datetime.date(2025, 5, 2), datetime.date(2025, 10, 24), datetime.date(2025, 12, 24)],
+        "work": [datetime.date(2025, 5, 17), datetime.date(2025, 10, 18), datetime.date(2025, 12, 13)],
+    },
+    2026: {
+        "rest": [datetime.date(2026, 1, 2), datetime.date(2026, 8, 21), datetime.date(2026, 12, 24)],
+        "work": [datetime.date(2026, 1, 10), datetime.date(2026, 8, 8), datetime.date(2026, 12, 12)],
+    },
+}
+
+_holidays = {}
+
+
+def easter_sunday(year):
+    """
+    Returns the date of Easter Sunday (anonymous Gregorian algorithm)
+    """
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return datetime.date(year, month, day + 1)
+
+
+def public_holidays(year):
+    """
+    Returns the set of public holidays of the year
+    """
+    if year not in _holidays:
+        easter = easter_sunday(year)
+        holidays = {datetime.date(year, month, day) for month, day in FIXED_HOLIDAYS}
+        holidays.add(easter + datetime.timedelta(days=1))
+        holidays.add(easter + datetime.timedelta(days=50))
+        # Good Friday is a public holiday since 2017
+        if year >= 2017:
+            holidays.add(easter - datetime.timedelta(days=2))
+        _holidays[year] = frozenset(holidays)
+    return _holidays[year]
+
+
+def is_business_day(date):
+    """
+    Returns True if the date is a working day in Hungary
+    """
+    swaps = DAY_SWAPS.get(date.year, {})
+    if date in swaps.get("work", ()):
+        return True
+    if date.weekday() >= 5 or date in swaps.get("rest", ()):
+        return False
+    return date not in public_holidays(date.year)
+
+
+def business_days(start_date, end_date):
+    """
+    Yields the business days of the inclusive date range
+    """
+    date = start_date
+    while date <= end_date:
+        if is_business_day(date):
+            yield date
+        date = date + datetime.timedelta(days=1)
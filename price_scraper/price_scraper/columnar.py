@@ -0,0 +1,135 @@
+"""
+Compact columnar binary format of the price files.
+
+Layout of a `.ppc` file (little endian):
+- 8 bytes magic `PPCOL001`
+- uint64 number of rows
+- int32 date column as proleptic Gregorian ordinals, sorted ascending and
+  padded with zeros to a multiple of 8 bytes
+- float64 price, volume, day_low and day_high columns, NaN marks a missing value
+
+The columns can be memory-mapped and date ranges sliced without parsing.
+
+Usage: python -m price_scraper.columnar <base_dir> [--output <dir>]
+"""
+import argparse
+import datetime
+import json
+from pathlib import Path
+
+import numpy as np
+
+from .util import normalize_date, write_atomic
+
+MAGIC = b"PPCOL001"
+HEADER_SIZE = 16
+VALUE_COLUMNS = ["price", "volume", "day_low", "day_high"]
+DATE_DTYPE = np.dtype("<i4")
+VALUE_DTYPE = np.dtype("<f8")
+
+
+class ColumnarPrices:
+    """
+    Memory-mapped columns of a columnar price file
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) != HEADER_SIZE or header[:8] != MAGIC:
+            raise ValueError(f"{path} is not a columnar price file")
+        self.rows = int(np.frombuffer(header, dtype="<u8", count=1, offset=8)[0])
+        offset = HEADER_SIZE
+        self.dates = self._map(path, DATE_DTYPE, offset)
+        offset += _padded(self.rows * DATE_DTYPE.itemsize)
+        for column in VALUE_COLUMNS:
+            setattr(self, column, self._map(path, VALUE_DTYPE, offset))
+            offset += self.rows * VALUE_DTYPE.itemsize
+
+    def _map(self, path, dtype, offset):
+        if not self.rows:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(self.rows,))
+
+    def date_range(self, start, end):
+        """
+        Returns the row slice of the dates between start and end, both inclusive
+        """
+        first = np.searchsorted(self.dates, start.toordinal(), side="left")
+        last = np.searchsorted(self.dates, end.toordinal(), side="right")
+        return slice(int(first), int(last))
+
+    def __len__(self):
+        return self.rows
+
+
+def encode_columnar(prices):
+    """
+    Returns the columnar file content of the given price rows.
+    Rows are ordered by date and the first row of a date wins.
+    """
+    rows = {}
+    for price in prices:
+        date = datetime.date.fromisoformat(normalize_date(price["date"]))
+        rows.setdefault(date.toordinal(), price)
+
+    ordinals = sorted(rows)
+    dates = np.array(ordinals, dtype=DATE_DTYPE)
+    chunks = [MAGIC, np.array([len(ordinals)], dtype="<u8").tobytes(), dates.tobytes()]
+    chunks.append(b"\0" * (_padded(dates.nbytes) - dates.nbytes))
+    for column in VALUE_COLUMNS:
+        values = [rows[ordinal].get(column) for ordinal in ordinals]
+        chunks.append(np.array(
+            [np.nan if value is None else value for value in values],
+            dtype=VALUE_DTYPE
+        ).tobytes())
+    return b"".join(chunks)
+
+
+def write_columnar(path, prices):
+    """
+    Writes the given price rows into a columnar file
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    write_atomic(path, [encode_columnar(prices)])
+
+
+def convert_json(json_path, columnar_path):
+    """
+    Converts a price json file into a columnar file
+    """
+    with open(json_path, "rb") as f:
+        write_columnar(columnar_path, json.load(f))
+
+
+def convert_tree(base_dir, output_dir):
+    """
+    Converts every `{base_dir}/*/*.json` price file into `{output_dir}/*/*.ppc`
+    and returns the number of converted files
+    """
+    count = 0
+    for json_path in sorted(Path(base_dir).glob("*/*.json")):
+        columnar_path = Path(output_dir) / json_path.parent.name / f"{json_path.stem}.ppc"
+        convert_json(json_path, columnar_path)
+        count += 1
+    return count
+
+
+def _padded(size):
+    return (size + 7) // 8 * 8
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base_dir", help="output directory of the spiders")
+    parser.add_argument("--output", default=None, help="columnar output directory, defaults to <base_dir>/columnar")
+    args = parser.parse_args()
+
+    output = args.output or f"{args.base_dir}/columnar"
+    count = convert_tree(args.base_dir, output)
+    print(f"Converted {count} files into {output}")
+
+
+if __name__ == "__main__":
+    main()
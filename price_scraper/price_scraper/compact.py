@@ -0,0 +1,94 @@
+"""
+Compacts the price files of an output tree.
+
+Every `{base_dir}/*/*.json` file is normalized: the dates are converted to
+`YYYY-MM-DD`, duplicated dates are dropped (the first stored price wins) and
+the rows are sorted by date. A file is rewritten only if its content changed.
+Files which can not be parsed, e.g. the half-written files of an interrupted run,
+are left untouched and listed in the report.
+
+Usage: python -m price_scraper.compact <base_dir> [--workers N]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from .price_exporter_pipeline import export_prices
+from .util import normalize_date, write_atomic
+
+
+def compact_file(file_path):
+    """
+    Compacts a single price file.
+    Returns the number of bytes read, whether the file was rewritten, the number of removed rows
+    and the error which prevented the compaction of the file or None.
+    """
+    prices = {}
+    try:
+        content = Path(file_path).read_bytes()
+        rows = json.loads(content)
+        for row in rows:
+            row["date"] = normalize_date(row["date"])
+            prices.setdefault(row["date"], row)
+    except (OSError, ValueError, KeyError, TypeError) as error:
+        return 0, False, 0, f"{type(error).__name__}: {error}"
+
+    compacted = export_prices(prices[date] for date in sorted(prices))
+    changed = compacted != content
+    if changed:
+        write_atomic(file_path, [compacted])
+    return len(content), changed, len(rows) - len(prices), None
+
+
+def compact_tree(base_dir, workers=None):
+    """
+    Compacts every price file under the given output directory in a process pool
+    """
+    files = sorted(str(path) for path in Path(base_dir).glob("*/*.json"))
+    start = time.perf_counter()
+    total_bytes = 0
+    touched = 0
+    removed = 0
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(files) // ((workers or os.cpu_count() or 1) * 4))
+        results = executor.map(compact_file, files, chunksize=chunksize)
+        for file_path, (size, changed, removed_rows, error) in zip(files, results):
+            total_bytes += size
+            touched += changed
+            removed += removed_rows
+            if error is not None:
+                failed.append((file_path, error))
+    elapsed = time.perf_counter() - start
+    return {
+        "files": len(files),
+        "files_touched": touched,
+        "rows_removed": removed,
+        "failed": failed,
+        "bytes": total_bytes,
+        "elapsed": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base_dir", help="output directory of the spiders")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    args = parser.parse_args()
+
+    result = compact_tree(args.base_dir, args.workers)
+    for file_path, error in result["failed"]:
+        print(f"Skipped {file_path}: {error}", file=sys.stderr)
+    elapsed = max(result["elapsed"], 1e-9)
+    print(f"Compacted {result['files']} files in {elapsed:.2f} s: "
+          f"{result['files_touched']} files touched, {result['rows_removed']} rows removed, "
+          f"{len(result['failed'])} files failed, "
+          f"{result['files'] / elapsed:.1f} files/s, {result['bytes'] / 1024 / 1024 / elapsed:.1f} MiB/s")
+
+
+if __name__ == "__main__":
+    main()
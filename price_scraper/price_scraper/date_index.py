@@ -0,0 +1,63 @@
+import datetime
+import sys
+from array import array
+from bisect import bisect_left
+
+from .util import normalize_date
+
+
+def date_ordinal(value):
+    """
+    Returns the proleptic Gregorian ordinal of a date in any representation
+    supported by `normalize_date`
+    """
+    if isinstance(value, str) and len(value) == 10 and value[4] == '-' and value[7] == '-':
+        return datetime.date.fromisoformat(value).toordinal()
+    return datetime.date.fromisoformat(normalize_date(value)).toordinal()
+
+
+class DateIndex:
+    """
+    Compact set of the stored dates of an instrument.
+
+    Dates are kept as a sorted array of day ordinals, so equivalent spellings
+    of a date match and membership checks are binary searches. Dates are mostly
+    added in increasing order which is a plain append.
+    """
+
+    def __init__(self, dates=()):
+        self.ordinals = array('i', sorted({date_ordinal(date) for date in dates}))
+
+    def __contains__(self, date):
+        ordinal = date_ordinal(date)
+        idx = bisect_left(self.ordinals, ordinal)
+        return idx < len(self.ordinals) and self.ordinals[idx] == ordinal
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    def add(self, date):
+        """
+        Adds the date to the index
+        """
+        ordinal = date_ordinal(date)
+        if not self.ordinals or self.ordinals[-1] < ordinal:
+            self.ordinals.append(ordinal)
+            return
+        idx = bisect_left(self.ordinals, ordinal)
+        if self.ordinals[idx] != ordinal:
+            self.ordinals.insert(idx, ordinal)
+
+    def last(self):
+        """
+        Returns the latest stored date or None
+        """
+        if not self.ordinals:
+            return None
+        return datetime.date.fromordinal(self.ordinals[-1])
+
+    def memory_usage(self):
+        """
+        Returns the number of bytes used by the index
+        """
+        return sys.getsizeof(self) + sys.getsizeof(self.ordinals)
@@ -1,83 +1,111 @@
+import csv
+import io
 from collections import defaultdict
-from pathlib import Path
 
 # useful for handling different item types with a single interface
+from itemadapter import ItemAdapter
 from scrapy.exporters import CsvItemExporter
 
-from .util import sanitize_file_name
+from .instruments import instrument_registry
+from .util import instruments_csv_path, write_atomic
+
+INSTRUMENT_FIELDS = ["ticker_symbol", "isin", "security_name", "currency", "note"]
+
+
+def read_instruments(path):
+    """
+    Returns the rows of an instrument csv keyed by ticker symbol or ISIN
+    """
+    if not path.exists():
+        return {}
+    with path.open(newline="", encoding="utf-8") as csv_file:
+        reader = csv.reader(csv_file, delimiter=";")
+        next(reader, None)
+        rows = {}
+        for row in reader:
+            fields = dict(zip(INSTRUMENT_FIELDS, row))
+            rows[fields.get("ticker_symbol") or fields.get("isin")] = fields
+        return rows
+
 
 class InstrumentExporterPipeline:
     """
     Collects all instruments found by a scraper and generates them as an importable
     instrument CSV for Portfolio Performance.
+
+    The csv is rewritten on close. Instruments of the previous csv which were not
+    seen during the run (their prices were known or their response was unchanged)
+    keep their row, so the csv always lists every instrument of the output directory.
+    The csv is left untouched when its content does not change, e.g. when the run
+    was skipped on a non-business day.
+
+    Price series items are handled like single prices, an instrument is recorded once.
+    Instruments are resolved through the instrument registry of the run.
     """
 
     def __init__(self):
         self.csv_output = None
         self.stored_instruments = defaultdict(set)
-        self.csv_file = None
-        self.csv_exporter = None
+        # instrument id => exported fields, the previous rows come first
+        self.rows = {}
 
     def open_spider(self, spider):
         """
         Called upon creating the spider
         """
-        filename = "mak" if spider.name == "mak_historical" else spider.name
-        self.csv_output = Path(spider.base_dir) / "instruments" / f"{filename}.csv"
+        self.csv_output = instruments_csv_path(spider.base_dir, spider.name)
         self.csv_output.parent.mkdir(parents=True, exist_ok=True)
-        # file_name => instruments
-        self.csv_file = self.csv_output.open("wb")
-        self.csv_file.write(b"ticker symbol;isin;security name;currency;note;\n")
-        self.csv_exporter = CsvItemExporter(
-            self.csv_file,
-            include_headers_line=False,
-            fields_to_export=["ticker_symbol", "isin", "security_name", "currency", "note"],
-            delimiter=";"
-        )
+        self.rows = read_instruments(self.csv_output)
 
     def close_spider(self, _spider):
         """
         Called upon closing the spider
         """
-        self.csv_exporter.finish_exporting()
-        self.csv_file.close()
+        self._finish_exporting()
 
-    def _mark_item_as_recorded(self, item, instruments_file):
+    def _finish_exporting(self):
+        if not self.stored_instruments and self.csv_output.exists():
+            return
+        csv_file = io.BytesIO()
+        csv_file.write(b"ticker symbol;isin;security name;currency;note;\n")
+        exporter = CsvItemExporter(
+            csv_file,
+            include_headers_line=False,
+            fields_to_export=INSTRUMENT_FIELDS,
+            delimiter=";"
+        )
+        exporter.start_exporting()
+        for fields in self.rows.values():
+            exporter.export_item(fields)
+        exporter.finish_exporting()
+        content = csv_file.getvalue()
+        if self.csv_output.exists() and self.csv_output.read_bytes() == content:
+            return
+        write_atomic(self.csv_output, [content])
+
+    def _mark_item_as_recorded(self, instrument, instruments_file):
         """
         Marks that the given instrument was written to the csv
         """
-        self.stored_instruments[instruments_file].add(get_instrument_id(item))
+        self.stored_instruments[instruments_file].add(instrument.instrument_id)
 
-    def _item_is_recorded(self, item, instruments_file):
+    def _item_is_recorded(self, instrument, instruments_file):
         """
         Checks if the given instrument was written to the csv
         """
-        return get_instrument_id(item) in self.stored_instruments[instruments_file]
+        return instrument.instrument_id in self.stored_instruments[instruments_file]
 
     def process_item(self, item, spider):
         """
         Creates an instrument from the given items which is stored in csv
         """
-        item['note'] = f"JSON feed url: {feed_url(spider.name, item['file_name'])}"
-        if self._item_is_recorded(item, spider.name):
+        instrument = instrument_registry(spider).resolve(item)
+        item['note'] = instrument.file.note
+        if self._item_is_recorded(instrument, spider.name):
             spider.logger.debug("Ignored item, it is already recorded in instruments")
             return item
-        self.csv_exporter.export_item(item)
-        self._mark_item_as_recorded(item, spider.name)
+        self._mark_item_as_recorded(instrument, spider.name)
+        # the item may still change in the following pipelines, the price columns are not copied
+        adapter = ItemAdapter(item)
+        self.rows[instrument.instrument_id] = {field: adapter[field] for field in INSTRUMENT_FIELDS if field in adapter}
         return item
-
-def feed_url(output_dir, name):
-    """
-    Creates a statically URL based on the given arguments
-    """
-    name = sanitize_file_name(name)
-    return f"https://cdn.statically.io/gh/havasd/pp-data/main/{output_dir}/{name}.json"
-
-def get_instrument_id(item):
-    """
-    Returns the instrument id from the given item
-    """
-    if 'ticker_symbol' in item.keys():
-        return item['ticker_symbol']
-    else:
-        return item['isin']
@@ -0,0 +1,111 @@
+"""
+Per run registry of the instruments scraped by a spider.
+
+The data derived from the file name of an instrument (sanitized name, output
+path, feed url) is computed once when the file name shows up first and every
+later item of the instrument resolves to the same record with a dict lookup.
+Instruments whose file names sanitize to the same name share a file record.
+"""
+from pathlib import Path
+
+from .util import output_directory_name, sanitize_file_name
+
+
+def feed_url(output_dir, name):
+    """
+    Creates a statically URL based on the given arguments
+    """
+    name = sanitize_file_name(name)
+    return f"https://cdn.statically.io/gh/havasd/pp-data/main/{output_dir}/{name}.json"
+
+
+class InstrumentFile:
+    """
+    Record of a price file
+    """
+
+    __slots__ = ("name", "json_path", "feed_url", "note")
+
+    def __init__(self, name, json_path, url):
+        # sanitized file name, the name of the price file
+        self.name = name
+        self.json_path = json_path
+        self.feed_url = url
+        self.note = f"JSON feed url: {url}"
+
+
+class Instrument:
+    """
+    Record of an instrument resolved from its file name
+    """
+
+    __slots__ = ("file_name", "file", "ticker_symbol", "isin", "instrument_id")
+
+    def __init__(self, file_name, file, ticker_symbol=None, isin=None):
+        self.file_name = file_name
+        self.file = file
+        self.ticker_symbol = ticker_symbol
+        self.isin = isin
+        # identifies the instrument in the instrument csv
+        self.instrument_id = ticker_symbol if ticker_symbol is not None else isin
+
+
+class InstrumentRegistry:
+    """
+    Instruments of a spider run keyed by their file name, ticker symbol and ISIN
+    """
+
+    def __init__(self, spider_name, base_dir):
+        self.spider_name = spider_name
+        self.directory = Path(base_dir) / output_directory_name(spider_name)
+        self.instruments = {}
+        # file name => price file
+        self.files = {}
+        # sanitized name => price file
+        self.files_by_name = {}
+
+    def __len__(self):
+        return len(self.instruments)
+
+    def get(self, file_name, ticker_symbol=None, isin=None):
+        """
+        Returns the record of the instrument, creates it when it is seen first
+        """
+        key = (file_name, ticker_symbol, isin)
+        instrument = self.instruments.get(key)
+        if instrument is None:
+            instrument = Instrument(file_name, self.file(file_name), ticker_symbol, isin)
+            self.instruments[key] = instrument
+        return instrument
+
+    def file(self, file_name):
+        """
+        Returns the record of the price file of a file name without creating an instrument
+        """
+        file = self.files.get(file_name)
+        if file is None:
+            name = sanitize_file_name(file_name)
+            file = self.files_by_name.get(name)
+            if file is None:
+                file = InstrumentFile(name, self.directory / f"{name}.json", feed_url(self.spider_name, name))
+                self.files_by_name[name] = file
+            self.files[file_name] = file
+        return file
+
+    def resolve(self, item):
+        """
+        Returns the record of the instrument of a price or price series item
+        """
+        return self.get(item["file_name"], item.get("ticker_symbol"), item.get("isin"))
+
+
+def instrument_registry(spider):
+    """
+    Returns the instrument registry of the spider run, it is created on first use
+    and shared by the pipelines through the spider
+    """
+    registry = getattr(spider, "instrument_registry", None)
+    if registry is None:
+        registry = InstrumentRegistry(spider.name, spider.base_dir)
+        spider.instrument_registry = registry
+    return registry
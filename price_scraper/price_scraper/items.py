@@ -35,3 +35,64 @@ class PortfolioPerformanceHistoricalPrice(scrapy.Item):
     ticker_symbol = scrapy.Field()
     # note about the instrument
     note = scrapy.Field()
+
+
+class PortfolioPerformancePriceSeries(scrapy.Item):
+    """
+    Contains the prices of a single instrument as columns.
+
+    The instrument data is given once and the i-th price belongs to the i-th
+    date. The optional columns have the same length as `dates`.
+    """
+
+    # name of the file to export the price data to
+    file_name = scrapy.Field()
+    # long name of the instrument
+    security_name = scrapy.Field()
+    # Currency of the fund
+    currency = scrapy.Field()
+    # Start date of the fund
+    start_date = scrapy.Field()
+    # ISIN if available
+    isin = scrapy.Field()
+    # symbol if available
+    ticker_symbol = scrapy.Field()
+    # note about the instrument
+    note = scrapy.Field()
+    # dates of the prices
+    dates = scrapy.Field()
+    # last prices
+    prices = scrapy.Field()
+    # volumes over the days, optional
+    volumes = scrapy.Field()
+    # lowest prices during the days, optional
+    day_lows = scrapy.Field()
+    # highest prices during the days, optional
+    day_highs = scrapy.Field()
+
+
+# price field => column of the price series
+SERIES_COLUMNS = {
+    "price": "prices",
+    "date": "dates",
+    "volume": "volumes",
+    "day_low": "day_lows",
+    "day_high": "day_highs",
+}
+
+
+def price_series(**fields):
+    """
+    Creates a price series of an instrument without prices
+    """
+    return PortfolioPerformancePriceSeries(dates=[], prices=[], **fields)
+
+
+def price_rows(series):
+    """
+    Yields the prices of a series as dicts with the fields of
+    PortfolioPerformanceHistoricalPrice
+    """
+    columns = [(field, series[column]) for field, column in SERIES_COLUMNS.items() if column in series]
+    for values in zip(*(values for _field, values in columns)):
+        yield {field: value for (field, _values), value in zip(columns, values)}
@@ -0,0 +1,29 @@
+class KnownDates:
+    """
+    Read-only view of the dates already stored by PriceExporterPipeline.
+
+    The pipeline attaches it to the spider as `known_dates`, so spiders can skip
+    building items for prices which would be dropped as duplicates anyway.
+    """
+
+    def __init__(self, pipeline, stats=None):
+        self.pipeline = pipeline
+        self.stats = stats
+
+    def contains(self, file_name, date):
+        """
+        Checks if the price of the instrument is already stored for the date
+        """
+        known = self.pipeline.is_stored(file_name, date)
+        if known and self.stats is not None:
+            self.stats.inc_value("known_dates/prefiltered")
+        return known
+
+
+def is_known_date(spider, file_name, date):
+    """
+    Checks if the spider's output already contains the price of the instrument
+    for the date. Always False when the price exporter pipeline is not enabled.
+    """
+    known_dates = getattr(spider, "known_dates", None)
+    return known_dates is not None and known_dates.contains(file_name, date)
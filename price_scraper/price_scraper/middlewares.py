@@ -3,11 +3,19 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import datetime
+import hashlib
+import json
+
 from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
 
+from .business_days import is_business_day
+from .util import instruments_csv_path, spider_state_path, write_atomic
+
 
 class PriceScraperSpiderMiddleware:
     # Not all methods need to be defined. If a method is not defined,
@@ -101,3 +109,195 @@ class PriceScraperDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+
+class FingerprintStore:
+    """
+    Json file of values keyed by request fingerprint which survives between runs.
+
+    The file is specific to a spider and to its output directory, so scraping
+    into a new directory does not reuse the state of another one. The previous
+    values are ignored when the instrument csv of the output directory is missing
+    (e.g. a fresh checkout of the data), every response is parsed again then.
+    """
+
+    def __init__(self, directory, spider):
+        self.path = spider_state_path(directory, spider, ".json")
+        self.previous = {}
+        output = instruments_csv_path(getattr(spider, "base_dir", ""), spider.name)
+        if self.path.exists() and output.exists():
+            with self.path.open("rb") as f:
+                self.previous = json.load(f)
+        self.current = {}
+
+    def save(self):
+        """
+        Stores the values of the current run merged over the previous ones
+        """
+        data = {**self.previous, **self.current}
+        write_atomic(self.path, [json.dumps(data, indent=1, sort_keys=True).encode("utf-8")])
+
+
+class ConditionalRequestMiddleware:
+    """
+    Sends the validators of the previous run's response (`If-None-Match` and
+    `If-Modified-Since`) and drops `304 Not Modified` responses before they
+    reach the spider callback, because their content is already in the output.
+
+    It is enabled per GET request with the `skip_not_modified` meta key, Splash
+    requests are left untouched. Only use it for requests whose callback yields
+    items and no new requests, a dropped listing page would skip its follow-ups.
+    """
+
+    def __init__(self, settings, stats, fingerprinter):
+        if not settings.getbool("CONDITIONAL_REQUESTS_ENABLED"):
+            raise NotConfigured
+        self.directory = settings.get("CONDITIONAL_REQUESTS_DIR")
+        self.stats = stats
+        self.fingerprinter = fingerprinter
+        self.store = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = cls(crawler.settings, crawler.stats, crawler.request_fingerprinter)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def spider_opened(self, spider):
+        self.store = FingerprintStore(self.directory, spider)
+
+    def spider_closed(self, spider, reason):
+        # an interrupted run may not have stored the content of the responses
+        if reason == "finished":
+            self.store.save()
+        requests = self.stats.get_value("conditional_requests/requests", 0)
+        if requests:
+            hits = self.stats.get_value("conditional_requests/not_modified", 0)
+            self.stats.set_value("conditional_requests/hit_rate", hits / requests)
+
+    def _handles(self, request):
+        return (
+            request.method == "GET"
+            and request.meta.get("skip_not_modified")
+            and "splash" not in request.meta
+        )
+
+    def process_request(self, request, spider):
+        if not self._handles(request):
+            return None
+        validators = self.store.previous.get(self.fingerprinter.fingerprint(request).hex())
+        if not validators:
+            return None
+        if validators.get("etag"):
+            request.headers.setdefault("If-None-Match", validators["etag"])
+        if validators.get("last_modified"):
+            request.headers.setdefault("If-Modified-Since", validators["last_modified"])
+        self.stats.inc_value("conditional_requests/requests")
+        return None
+
+    def process_response(self, request, response, spider):
+        if not self._handles(request):
+            return response
+        fingerprint = self.fingerprinter.fingerprint(request).hex()
+        if response.status == 304 and fingerprint in self.store.previous:
+            self.stats.inc_value("conditional_requests/not_modified")
+            self.stats.inc_value("conditional_requests/bytes_saved", self.store.previous[fingerprint]["size"])
+            raise IgnoreRequest(f"Not modified since the previous run: {request.url}")
+        if response.status == 200:
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            if etag or last_modified:
+                self.store.current[fingerprint] = {
+                    "etag": etag.decode("latin-1") if etag else None,
+                    "last_modified": last_modified.decode("latin-1") if last_modified else None,
+                    "size": len(response.body),
+                }
+        return response
+
+
+class ContentHashMiddleware:
+    """
+    Drops responses whose body is byte-identical to the previous run's response
+    before they reach the spider callback.
+
+    It is enabled per request with the `skip_unchanged` meta key. The value is
+    either True to compare by request fingerprint or a string key for requests
+    whose url changes between runs (e.g. because of a date range).
+    Only use it for requests whose callback yields items and no new requests.
+    The instruments of a dropped response keep their row in the instrument csv,
+    see `InstrumentExporterPipeline`.
+    """
+
+    def __init__(self, settings, stats, fingerprinter):
+        if not settings.getbool("CONTENT_HASH_ENABLED"):
+            raise NotConfigured
+        self.directory = settings.get("CONTENT_HASH_DIR")
+        self.stats = stats
+        self.fingerprinter = fingerprinter
+        self.store = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = cls(crawler.settings, crawler.stats, crawler.request_fingerprinter)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def spider_opened(self, spider):
+        self.store = FingerprintStore(self.directory, spider)
+
+    def spider_closed(self, spider, reason):
+        # an interrupted run may not have stored the content of the responses
+        if reason == "finished":
+            self.store.save()
+
+    def process_response(self, request, response, spider):
+        key = request.meta.get("skip_unchanged")
+        if not key or response.status != 200:
+            return response
+        if key is True:
+            key = self.fingerprinter.fingerprint(request).hex()
+        digest = hashlib.sha256(response.body).hexdigest()
+        self.store.current[key] = digest
+        if self.store.previous.get(key) == digest:
+            self.stats.inc_value("content_hash/unchanged")
+            self.stats.inc_value("content_hash/bytes_skipped", len(response.body))
+            raise IgnoreRequest(f"Content did not change since the previous run: {request.url}")
+        self.stats.inc_value("content_hash/changed")
+        return response
+
+
+class BusinessDayMiddleware:
+    """
+    Drops the start requests of the daily spiders (`business_days_only = True`)
+    when no new prices are expected, i.e. neither today nor the previous
+    `BUSINESS_DAY_PUBLICATION_LAG` days are business days.
+    """
+
+    def __init__(self, settings, stats):
+        if not settings.getbool("SKIP_NON_BUSINESS_DAYS"):
+            raise NotConfigured
+        self.lag = settings.getint("BUSINESS_DAY_PUBLICATION_LAG")
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings, crawler.stats)
+
+    def process_start_requests(self, start_requests, spider):
+        today = datetime.date.today()
+        if getattr(spider, "business_days_only", False) and not self.prices_expected(today):
+            spider.logger.info("No new prices are expected on %s, skipping the run", today)
+            self.stats.set_value("business_days/skipped_run", 1)
+            return
+        yield from start_requests
+
+    def prices_expected(self, date):
+        """
+        Returns True if a business day is within the publication lag of the date
+        """
+        return any(
+            is_business_day(date - datetime.timedelta(days=days))
+            for days in range(self.lag + 1)
+        )
@@ -0,0 +1,247 @@
+"""
+Text extraction of PDF reports in worker processes
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import subprocess
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from pdf2image import convert_from_path, pdfinfo_from_bytes
+from PIL import Image
+import pytesseract
+from scrapy.utils.project import data_path
+
+from .util import write_atomic
+
+
+def ocr_options(settings):
+    """
+    Returns the options of the text extraction. They are part of the cache key,
+    so changing them invalidates the cached texts.
+    """
+    crop = settings.getlist("OCR_CROP")
+    return {
+        "mode": settings.get("OCR_MODE"),
+        "min_chars": settings.getint("OCR_TEXT_LAYER_MIN_CHARS"),
+        "dpi": settings.getint("OCR_DPI"),
+        "grayscale": settings.getbool("OCR_GRAYSCALE"),
+        "crop": [float(value) for value in crop] if crop else None,
+        "binarize": settings.getbool("OCR_BINARIZE"),
+        "deskew_max_angle": settings.getfloat("OCR_DESKEW_MAX_ANGLE"),
+        "lang": settings.get("OCR_LANG"),
+    }
+
+
+def pdf_to_pages(data, options):
+    """
+    Returns the text of every page of the PDF as `(text, method, seconds)` tuples.
+
+    In "text" mode the layout preserving text layer is used and pages with
+    less than `min_chars` non-whitespace characters fall back to OCR.
+    In "ocr" mode every page is rendered and OCR'd.
+    Pages are rendered one at a time, so the memory usage does not depend
+    on the number of pages.
+    Runs in the worker processes, so it must stay a picklable module level function.
+    """
+    page_count = pdfinfo_from_bytes(data)["Pages"]
+    pages = []
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as pdf:
+        pdf.write(data)
+        pdf.flush()
+        for page in range(1, page_count + 1):
+            start = time.perf_counter()
+            if options["mode"] == "text":
+                text = _text_layer(pdf.name, page)
+                if len("".join(text.split())) >= options["min_chars"]:
+                    pages.append((text, "text_layer", time.perf_counter() - start))
+                    continue
+            text = _ocr(pdf.name, page, options)
+            pages.append((text, "ocr", time.perf_counter() - start))
+    return pages
+
+
+def _text_layer(path, page):
+    result = subprocess.run(
+        ["pdftotext", "-layout", "-enc", "UTF-8", "-f", str(page), "-l", str(page), path, "-"],
+        capture_output=True,
+        check=True
+    )
+    return result.stdout.decode("utf-8")
+
+
+def _ocr(path, page, options):
+    image = convert_from_path(
+        path,
+        dpi=options["dpi"],
+        first_page=page,
+        last_page=page,
+        grayscale=options["grayscale"]
+    )[0]
+    image = preprocess_image(image, options)
+    return pytesseract.image_to_string(image, lang=options["lang"])
+
+
+def preprocess_image(image, options):
+    """
+    Crops the page to the table region (`crop` as left, top, right, bottom
+    fractions of the page), then binarizes and deskews it
+    """
+    if options["crop"]:
+        left, top, right, bottom = options["crop"]
+        width, height = image.size
+        image = image.crop((int(left * width), int(top * height), int(right * width), int(bottom * height)))
+    if not options["binarize"]:
+        return image
+    pixels = np.asarray(image.convert("L"))
+    binary = np.where(pixels > otsu_threshold(pixels), 255, 0).astype(np.uint8)
+    image = Image.fromarray(binary)
+    if options["deskew_max_angle"]:
+        angle = skew_angle(binary, options["deskew_max_angle"])
+        if angle:
+            image = image.rotate(angle, resample=Image.NEAREST, fillcolor=255)
+    return image
+
+
+def otsu_threshold(pixels):
+    """
+    Returns the gray level which separates the dark and the light pixels
+    with the largest between-class variance
+    """
+    histogram = np.bincount(pixels.ravel(), minlength=256).astype(np.float64)
+    weighted = histogram * np.arange(256)
+    dark_count = np.cumsum(histogram)
+    light_count = dark_count[-1] - dark_count
+    dark_sum = np.cumsum(weighted)
+    dark_mean = dark_sum / np.maximum(dark_count, 1)
+    light_mean = (dark_sum[-1] - dark_sum) / np.maximum(light_count, 1)
+    variance = dark_count * light_count * (dark_mean - light_mean) ** 2
+    return int(np.argmax(variance))
+
+
+def skew_angle(binary, max_angle, step=0.1, max_pixels=200_000):
+    """
+    Returns the rotation in degrees which aligns the text lines of a binary
+    image with the rows. The dark pixels are projected onto the rows at every
+    candidate angle and the sharpest projection wins.
+    """
+    rows, columns = np.nonzero(binary == 0)
+    if len(rows) == 0:
+        return 0.0
+    if len(rows) > max_pixels:
+        rows = rows[::len(rows) // max_pixels + 1]
+        columns = columns[::len(columns) // max_pixels + 1]
+    angles = np.arange(-max_angle, max_angle + step / 2, step)
+    scores = []
+    for angle in angles:
+        projected = np.rint(rows - columns * np.tan(np.radians(angle))).astype(np.int64)
+        profile = np.bincount(projected - projected.min()).astype(np.float64)
+        scores.append(np.dot(profile, profile))
+    return round(float(angles[int(np.argmax(scores))]), 2)
+
+
+def record_page_stats(stats, pages):
+    """
+    Counts the pages and the time spent per extraction method
+    """
+    for _, method, seconds in pages:
+        count = stats.get_value(f"pdf_text/pages/{method}", 0) + 1
+        total = stats.get_value(f"pdf_text/seconds/{method}", 0) + seconds
+        stats.set_value(f"pdf_text/pages/{method}", count)
+        stats.set_value(f"pdf_text/seconds/{method}", total)
+        stats.set_value(f"pdf_text/page_ms/{method}", round(total / count * 1000, 1))
+
+
+def create_ocr_pool(settings):
+    """
+    Creates the process pool of the OCR work, its size is `OCR_POOL_SIZE`
+    or the number of cores
+    """
+    workers = settings.getint("OCR_POOL_SIZE") or os.cpu_count()
+    # forking a process with running reactor threads is unsafe
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+class OcrCache:
+    """
+    On-disk cache of the page texts of PDFs keyed by the SHA-256 of the PDF
+    and the OCR options.
+
+    Entries are json files under `directory`. When the cache grows over
+    `max_size` bytes the least recently used entries are removed.
+    """
+
+    def __init__(self, directory, max_size, stats):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.stats = stats
+        self.hits = 0
+        self.misses = 0
+        # path -> size ordered from the least recently used entry
+        self.entries = OrderedDict()
+        paths = [(path.stat(), path) for path in self.directory.glob("*/*.json")]
+        for stat, path in sorted(paths, key=lambda entry: entry[0].st_mtime):
+            self.entries[path] = stat.st_size
+        self.size = sum(self.entries.values())
+
+    @classmethod
+    def from_settings(cls, settings, stats):
+        if not settings.getbool("OCR_CACHE_ENABLED"):
+            return None
+        directory = data_path(settings.get("OCR_CACHE_DIR"), createdir=True)
+        return cls(directory, settings.getint("OCR_CACHE_MAX_SIZE"), stats)
+
+    @staticmethod
+    def key(data, options):
+        """
+        Returns the cache key of a PDF extracted with the given options
+        """
+        digest = hashlib.sha256(data)
+        digest.update(json.dumps(options, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Returns the cached page texts or None
+        """
+        path = self._path(key)
+        try:
+            texts = json.loads(path.read_bytes())
+        except (FileNotFoundError, ValueError):
+            texts = None
+        if texts is None:
+            self.misses += 1
+            self.stats.inc_value("ocr_cache/misses")
+        else:
+            self.hits += 1
+            self.stats.inc_value("ocr_cache/hits")
+            os.utime(path)
+            if path in self.entries:
+                self.entries.move_to_end(path)
+        self.stats.set_value("ocr_cache/hit_rate", self.hits / (self.hits + self.misses))
+        return texts
+
+    def put(self, key, texts):
+        """
+        Stores the page texts and evicts the least recently used entries over the size limit
+        """
+        path = self._path(key)
+        data = json.dumps(texts).encode()
+        path.parent.mkdir(exist_ok=True)
+        write_atomic(path, [data])
+        self.size += len(data) - self.entries.pop(path, 0)
+        self.entries[path] = len(data)
+        while self.size > self.max_size and len(self.entries) > 1:
+            old_path, size = self.entries.popitem(last=False)
+            old_path.unlink(missing_ok=True)
+            self.size -= size
+            self.stats.inc_value("ocr_cache/evictions")
+
+    def _path(self, key):
+        return self.directory / key[:2] / f"{key}.json"
@@ -1,91 +1,756 @@
+import io
 import json
+import logging
+import sqlite3
 from pathlib import Path
-from collections import defaultdict
+from collections import Counter, OrderedDict
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
-from scrapy.exporters import JsonItemExporter
+from scrapy.exporters import JsonItemExporter, JsonLinesItemExporter
+from scrapy.settings import Settings
+from scrapy.utils.project import data_path
+from twisted.internet.defer import Deferred
+from twisted.python.failure import Failure
 
-from .util import truncate_utf8_chars, sanitize_file_name
+from .background_writer import BackgroundWriter
+from .columnar import convert_json
+from .date_index import DateIndex
+from .instruments import instrument_registry
+from .items import PortfolioPerformancePriceSeries, price_rows
+from .known_dates import KnownDates
+from .price_writer import EXPORTED_FIELDS, PriceJsonExporter
+from .util import (
+    directory_digest,
+    iter_stored_dates,
+    normalize_date,
+    output_directory_name,
+    read_stored_rows,
+    truncate_json_array,
+    write_atomic,
+)
 
-class PriceExporterPipeline:
+logger = logging.getLogger(__name__)
+
+# sent when every price processed so far is persisted, e.g. to record backfill progress
+prices_committed = object()
+
+
+def append_json_rows(file_path, rows, fsync=False):
     """
-    Groups the item by portfolio and writes them into a json file.
+    Atomically replaces a price json file with its content extended by the given
+    rows. Every row must be prefixed with a separator. A half-written tail of the
+    file is dropped.
+    """
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    content = file_path.read_bytes() if file_path.exists() else b""
+    # elements are flat objects so the last `}` closes the last complete one
+    element_end = content.rfind(b"}")
+    if element_end == -1:
+        head = b"["
+        rows = rows[1:]
+    else:
+        head = content[:element_end + 1]
+    write_atomic(file_path, [head, rows, b"\n]"], fsync=fsync)
 
-    Writing happens in an append only mode which means we load the files
-    and skip already stored data.
+
+def create_exporter(file, writer="scrapy"):
+    """
+    Creates a json exporter of price rows. The "fast" writer produces the same
+    output as the scrapy exporter from precomputed templates.
     """
+    if writer == "fast":
+        return PriceJsonExporter(file)
+    return JsonItemExporter(file, indent=True, fields_to_export=EXPORTED_FIELDS)
 
-    def __init__(self):
-        self.portfolio_to_exporter = {}
-        self.stored_dates = defaultdict(set)
-        self.base_directory = None
 
-    def open_spider(self, spider):
+def export_prices(prices, writer="scrapy"):
+    """
+    Returns the content of a complete price json file with the given prices
+    """
+    buffer = io.BytesIO()
+    exporter = create_exporter(buffer, writer)
+    exporter.start_exporting()
+    for price in prices:
+        exporter.export_item(price)
+    exporter.finish_exporting()
+    return buffer.getvalue()
+
+
+class PriceStorage:
+    """
+    Interface of the storage backends used by PriceExporterPipeline.
+
+    A backend is created for a single spider run and it is responsible for
+    persisting the prices of the instruments under `base_directory`. Instruments
+    are passed as the price file records of the instrument registry, the json
+    file of an instrument is at `file.json_path`.
+
+    The methods may run on the background writer thread, so the stats of the
+    backend are counted locally and published by the pipeline after close.
+    """
+
+    # the dates of an instrument without pending writes can be loaded
+    # on another thread than the one which writes the other instruments
+    concurrent_load = True
+
+    def __init__(self, base_directory, source, settings, stats=None):
+        self.base_directory = base_directory
+        self.source = source
+        self.settings = settings
+        self.stats = stats
+        self.counters = Counter()
+        self.writer = settings.get("PRICE_EXPORTER_WRITER", "scrapy")
+        # called after the stored prices were committed to disk before close
+        self.on_commit = None
+
+    def inc_stat(self, key, count=1):
         """
-        Called upon creating the spider
+        Increments a local stats value of the price exporter, see `publish_stats`
         """
-        dir_name = "mak" if spider.name == "mak_historical" else spider.name
-        self.base_directory = f"{spider.base_dir}/{dir_name}"
+        self.counters[key] += count
 
-    def close_spider(self, _spider):
+    def publish_stats(self):
         """
-        Called upon closing the spider
+        Adds the local stats values to the scrapy stats if stats are available.
+        It must be called on the reactor thread.
+        """
+        if self.stats is not None:
+            for key, count in self.counters.items():
+                self.stats.inc_value(f"price_exporter/{key}", count)
+        self.counters.clear()
+
+    def committed(self):
+        """
+        Reports that every price stored so far is on disk
+        """
+        if self.on_commit is not None:
+            self.on_commit()
+
+    def load_dates(self, file):
+        """
+        Returns the already stored dates for the given instrument
+        """
+        raise NotImplementedError
+
+    def store(self, file, item):
+        """
+        Stores a new price of the given instrument
+        """
+        raise NotImplementedError
+
+    def store_many(self, file, rows):
         """
+        Stores new prices of the given instrument
+        """
+        for row in rows:
+            self.store(file, row)
+
+    def close(self):
+        """
+        Flushes pending data and releases every resource of the backend
+        """
+        raise NotImplementedError
+
+
+class JsonStorage(PriceStorage):
+    """
+    Uses the per instrument json files as the storage.
+
+    Writing happens in an append only mode which means we load the files
+    and skip already stored data.
+
+    At most `PRICE_EXPORTER_POOL_SIZE` files are kept open. The least recently
+    used one is finished and closed when a new one is needed and it is reopened
+    in append mode when its instrument shows up again.
+    """
+
+    def __init__(self, base_directory, source, settings, stats=None):
+        super().__init__(base_directory, source, settings, stats)
+        self.portfolio_to_exporter = OrderedDict()
+        self.pool_size = settings.getint("PRICE_EXPORTER_POOL_SIZE", 128)
+
+    def load_dates(self, file):
+        if not file.json_path.exists():
+            return []
+        return iter_stored_dates(file.json_path)
+
+    def store(self, file, item):
+        self._pooled_exporter(file).export_item(item)
+
+    def store_many(self, file, rows):
+        exporter = self._pooled_exporter(file)
+        for row in rows:
+            exporter.export_item(row)
+
+    def close(self):
         for exporter, json_file in self.portfolio_to_exporter.values():
             exporter.finish_exporting()
             json_file.close()
+        self.portfolio_to_exporter.clear()
 
-    def _exporter_for_item(self, adapter):
-        name = sanitize_file_name(adapter["file_name"])
-        if name not in self.portfolio_to_exporter:
-            self._create_exporter(name)
-        return self.portfolio_to_exporter[name][0]
+    def _pooled_exporter(self, file):
+        """
+        Returns the open exporter of the instrument, opening it if needed
+        """
+        if file in self.portfolio_to_exporter:
+            self.portfolio_to_exporter.move_to_end(file)
+            self.inc_stat("pool_hits")
+        else:
+            self.inc_stat("pool_misses")
+            while len(self.portfolio_to_exporter) >= self.pool_size:
+                self._evict()
+            self._create_exporter(file)
+        return self.portfolio_to_exporter[file][0]
 
-    def process_item(self, item, spider):
+    def _evict(self):
         """
-        Exports price and date information to json files based on the passed name
+        Finishes and closes the least recently used exporter
         """
-        adapter = ItemAdapter(item)
-        exporter = self._exporter_for_item(adapter)
-        if adapter["date"] in self.stored_dates[sanitize_file_name(adapter["file_name"])]:
-            spider.logger.debug("Ignored item because it is already stored")
-            return item
-        exporter.export_item(item)
-        self.stored_dates[sanitize_file_name(adapter["file_name"])].add(adapter["date"])
-        return item
+        _file, (exporter, json_file) = self.portfolio_to_exporter.popitem(last=False)
+        exporter.finish_exporting()
+        json_file.close()
+        self.inc_stat("pool_evictions")
 
-    def _create_exporter(self, name):
+    def _create_exporter(self, file):
         """
         Creates an exporter. If the file already exists we will append to it.
         Otherwise we create a new one.
         """
 
-        file_path = Path(f"{self.base_directory}/{name}.json")
+        file_path = file.json_path
         file_path.parent.mkdir(parents=True, exist_ok=True)
         file_exists = file_path.exists()
-        if file_exists:
-            self._load_file(name, file_path)
-            truncate_utf8_chars(file_path, 2, ignore_newlines=False)
+        has_rows = file_exists and truncate_json_array(file_path)
         json_file = file_path.open("ab" if file_exists else "wb")
-        exporter = JsonItemExporter(json_file,
-            indent=True,
-            fields_to_export=['price', 'date', 'volume', 'day_low', 'day_high']
-        )
-        if file_exists:
+        exporter = create_exporter(json_file, self.writer)
+        if has_rows:
             exporter.first_item = False
-        else:
+        elif not file_exists:
             exporter.start_exporting()
-        self.portfolio_to_exporter[name] = (exporter, json_file)
+        self.portfolio_to_exporter[file] = (exporter, json_file)
+
+
+class BatchedJsonStorage(JsonStorage):
+    """
+    Buffers the new prices per instrument in memory and commits them to the
+    json files in batches.
+
+    A flush happens when the buffered item count or size reaches its threshold
+    and when the spider is closed. Every file is rewritten into a temporary file
+    which is renamed over the original, so an interrupted run never leaves
+    an unparseable json file behind.
+    """
+
+    def __init__(self, base_directory, source, settings, stats=None):
+        super().__init__(base_directory, source, settings, stats)
+        self.flush_items = settings.getint("PRICE_EXPORT_FLUSH_ITEMS")
+        self.flush_bytes = settings.getint("PRICE_EXPORT_FLUSH_BYTES")
+        self.fsync = settings.get("PRICE_EXPORT_FSYNC")
+        self.buffered_items = 0
+        self.buffered_bytes = 0
+
+    def store(self, file, item):
+        self.store_many(file, [item])
+
+    def store_many(self, file, rows):
+        if file not in self.portfolio_to_exporter:
+            self._create_exporter(file)
+        exporter, buffer = self.portfolio_to_exporter[file]
+        size = buffer.tell()
+        for row in rows:
+            exporter.export_item(row)
+        self.buffered_items += len(rows)
+        self.buffered_bytes += buffer.tell() - size
+        if self.buffered_items >= self.flush_items or self.buffered_bytes >= self.flush_bytes:
+            self.flush(fsync=self.fsync == "always")
+
+    def close(self):
+        self.flush(fsync=self.fsync in ("always", "close"))
+        self.portfolio_to_exporter.clear()
+
+    def flush(self, fsync=False):
+        """
+        Commits every buffered price into the json files
+        """
+        for file, (_exporter, buffer) in self.portfolio_to_exporter.items():
+            if buffer.tell():
+                append_json_rows(file.json_path, buffer.getvalue(), fsync)
+                buffer.seek(0)
+                buffer.truncate()
+        self.buffered_items = 0
+        self.buffered_bytes = 0
+        self.committed()
+
+    def _create_exporter(self, file):
+        """
+        Creates an exporter which writes into an in memory buffer
+        """
+        buffer = io.BytesIO()
+        exporter = create_exporter(buffer, self.writer)
+        # every row is prefixed with a separator, it is removed for the first row of a new file
+        exporter.first_item = False
+        self.portfolio_to_exporter[file] = (exporter, buffer)
+
+
+class JournalJsonStorage(JsonStorage):
+    """
+    Appends the new prices of an instrument to a journal file next to its json
+    file, one json object per line, and merges the journals into the json arrays
+    at checkpoints: every `PRICE_EXPORT_CHECKPOINT_ITEMS` items and on close.
+
+    Appends are pure sequential writes and the json files are only replaced
+    atomically. A journal left behind by an interrupted run is merged when its
+    instrument is loaded again, a half-written last line is dropped.
+    """
+
+    def __init__(self, base_directory, source, settings, stats=None):
+        super().__init__(base_directory, source, settings, stats)
+        self.checkpoint_items = settings.getint("PRICE_EXPORT_CHECKPOINT_ITEMS")
+        self.fsync = settings.get("PRICE_EXPORT_FSYNC")
+        self.journaled_items = 0
+        self.journaled_instruments = set()
+
+    @staticmethod
+    def journal_path(file):
+        """
+        Returns the path of the journal file of the given instrument
+        """
+        return file.json_path.with_suffix(".journal")
+
+    def load_dates(self, file):
+        if self.journal_path(file).exists():
+            logger.warning("Recovering journal of %s/%s", self.source, file.name)
+            self._merge_journal(file, fsync=self.fsync != "never")
+            self.inc_stat("journals_recovered")
+        return super().load_dates(file)
+
+    def store(self, file, item):
+        self.store_many(file, [item])
+
+    def store_many(self, file, rows):
+        super().store_many(file, rows)
+        self.journaled_instruments.add(file)
+        self.journaled_items += len(rows)
+        if self.journaled_items >= self.checkpoint_items:
+            self.checkpoint(fsync=self.fsync == "always")
+
+    def close(self):
+        self.checkpoint(fsync=self.fsync in ("always", "close"))
+
+    def checkpoint(self, fsync=False):
+        """
+        Closes the journals and merges them into the json files
+        """
+        super().close()
+        for file in sorted(self.journaled_instruments, key=lambda file: file.name):
+            self._merge_journal(file, fsync)
+        self.journaled_instruments.clear()
+        self.journaled_items = 0
+        self.committed()
+
+    def _create_exporter(self, file):
+        """
+        Creates an exporter which appends to the journal of the instrument
+        """
+        journal_path = self.journal_path(file)
+        journal_path.parent.mkdir(parents=True, exist_ok=True)
+        journal_file = journal_path.open("ab")
+        exporter = JsonLinesItemExporter(journal_file, fields_to_export=EXPORTED_FIELDS)
+        self.portfolio_to_exporter[file] = (exporter, journal_file)
+
+    def _merge_journal(self, file, fsync=False):
+        """
+        Appends the complete, not yet stored rows of the journal to the json file
+        and removes the journal
+        """
+        journal_path = self.journal_path(file)
+        json_path = file.json_path
+        stored = set(iter_stored_dates(json_path)) if json_path.exists() else set()
+        buffer = io.BytesIO()
+        exporter = create_exporter(buffer, self.writer)
+        exporter.first_item = False
+        with journal_path.open("rb") as journal_file:
+            for line in journal_file:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    # half-written line of an interrupted run
+                    break
+                if row["date"] in stored:
+                    continue
+                stored.add(row["date"])
+                exporter.export_item(row)
+        if buffer.tell():
+            append_json_rows(json_path, buffer.getvalue(), fsync)
+        journal_path.unlink()
+
+
+class SqliteStorage(PriceStorage):
+    """
+    Stores the prices in an SQLite database keyed on (source, instrument, date).
+    Every output directory has its own database, the digest of the directory
+    is appended to the name of `PRICE_STORAGE_SQLITE_PATH`.
+
+    New prices are upserted in batched transactions and the json files are
+    regenerated from the database only for the instruments which changed
+    during the run. The existing json file of an instrument is merged into the
+    database when its dates are loaded, so prices written by other means are
+    kept when the file is regenerated.
+
+    The connection is used by a single thread at a time, with `ASYNC_OUTPUT_ENABLED`
+    every operation including the loading of the dates runs on the writer thread.
+    """
+
+    concurrent_load = False
+
+    def __init__(self, base_directory, source, settings, stats=None):
+        super().__init__(base_directory, source, settings, stats)
+        database = Path(data_path(settings.get("PRICE_STORAGE_SQLITE_PATH")))
+        # base_directory is <base_dir>/<source>, the sources of a base_dir share the database
+        digest = directory_digest(Path(base_directory).parent)
+        database = database.with_name(f"{database.stem}-{digest}{database.suffix}")
+        database.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = settings.getint("PRICE_STORAGE_SQLITE_BATCH_SIZE")
+        # it is created on the reactor thread and used on the background writer thread
+        self.connection = sqlite3.connect(database, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS prices (
+                source TEXT NOT NULL,
+                instrument TEXT NOT NULL,
+                date TEXT NOT NULL,
+                price,
+                volume,
+                day_low,
+                day_high,
+                PRIMARY KEY (source, instrument, date)
+            ) WITHOUT ROWID
+        """)
+        self.pending_rows = []
+        self.changed_instruments = set()
 
-    def _load_file(self, name, file_path):
-        """Stores the dates for a particular file name and returns the loaded data"""
-        if name in self.stored_dates:
+    def load_dates(self, file):
+        self._import_json(file)
+        cursor = self.connection.execute(
+            "SELECT date FROM prices WHERE source = ? AND instrument = ?",
+            (self.source, file.name)
+        )
+        return [row[0] for row in cursor]
+
+    def store(self, file, item):
+        self.store_many(file, [ItemAdapter(item)])
+
+    def store_many(self, file, rows):
+        self.pending_rows.extend(
+            (
+                self.source,
+                file.name,
+                str(row["date"]),
+                *(row.get(field) for field in EXPORTED_FIELDS if field != "date"),
+            )
+            for row in rows
+        )
+        self.changed_instruments.add(file)
+        if len(self.pending_rows) >= self.batch_size:
+            self._flush()
+
+    def close(self):
+        self._flush()
+        for file in sorted(self.changed_instruments, key=lambda file: file.name):
+            self._export_json(file)
+        self.changed_instruments.clear()
+        self.connection.close()
+
+    def _flush(self):
+        """
+        Upserts the pending rows in a single transaction
+        """
+        if not self.pending_rows:
             return
+        with self.connection:
+            self.connection.executemany("""
+                INSERT INTO prices (source, instrument, date, price, volume, day_low, day_high)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (source, instrument, date) DO UPDATE SET
+                    price = excluded.price,
+                    volume = excluded.volume,
+                    day_low = excluded.day_low,
+                    day_high = excluded.day_high
+            """, self.pending_rows)
+        self.pending_rows = []
+        self.committed()
+
+    def _import_json(self, file):
+        """
+        Adds the rows of the existing json file of an instrument which are missing
+        from the database, e.g. the ones written by the json backend or pulled
+        with the data repository. Rows already in the database are kept.
+        """
+        file_path = file.json_path
         if not file_path.exists():
             return
 
-        with file_path.open("rb") as f:
-            data = json.load(f)
-            for elem in data:
-                self.stored_dates[name].add(elem["date"])
+        data = read_stored_rows(file_path)
+        with self.connection:
+            self.connection.executemany("""
+                INSERT OR IGNORE INTO prices (source, instrument, date, price, volume, day_low, day_high)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [
+                (
+                    self.source,
+                    file.name,
+                    normalize_date(elem["date"]),
+                    *(elem.get(field) for field in EXPORTED_FIELDS if field != "date"),
+                )
+                for elem in data
+            ])
+
+    def _export_json(self, file):
+        """
+        Regenerates the json file of an instrument from the database
+        """
+        cursor = self.connection.execute("""
+            SELECT price, date, volume, day_low, day_high FROM prices
+            WHERE source = ? AND instrument = ? ORDER BY date
+        """, (self.source, file.name))
+        content = export_prices((
+            {field: value for field, value in zip(EXPORTED_FIELDS, row) if value is not None}
+            for row in cursor
+        ), self.writer)
+        file_path = file.json_path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(file_path, [content], fsync=self.settings.get("PRICE_EXPORT_FSYNC") != "never")
+
+
+STORAGE_BACKENDS = {
+    "json": JsonStorage,
+    "sqlite": SqliteStorage,
+}
+
+JSON_COMMIT_MODES = {
+    "append": JsonStorage,
+    "batched": BatchedJsonStorage,
+    "journal": JournalJsonStorage,
+}
+
+
+def storage_backend(settings):
+    """
+    Returns the storage backend class configured in the settings
+    """
+    backend = settings.get("PRICE_STORAGE_BACKEND", "json")
+    if backend == "json":
+        return JSON_COMMIT_MODES[settings.get("PRICE_EXPORT_COMMIT_MODE", "append")]
+    return STORAGE_BACKENDS[backend]
+
+
+class PriceExporterPipeline:
+    """
+    Groups the item by portfolio and writes them into a json file.
+
+    Persisting the prices is delegated to a storage backend selected by the
+    `PRICE_STORAGE_BACKEND` setting. Dates are normalized to `YYYY-MM-DD`
+    and already stored dates are skipped.
+
+    When `PRICE_EXPORT_COLUMNAR` is enabled the changed instruments are also
+    exported into the columnar binary format on close.
+
+    When `ASYNC_OUTPUT_ENABLED` is set every storage operation runs on a
+    background writer thread and the deduplication stays on the reactor thread.
+    The stored dates of an instrument are loaded before anything of it is queued,
+    so they are read on the reactor thread without waiting for the queue. Storages
+    which can not be loaded concurrently read them on the writer thread and the
+    items of the instrument wait for a Deferred meanwhile.
+
+    A PortfolioPerformancePriceSeries item is deduplicated and stored as
+    a whole with a single storage call.
+
+    The `prices_committed` signal is sent when the storage closed cleanly and,
+    without the background writer, whenever the storage commits during the run.
+    """
+
+    def __init__(self, settings=None, stats=None, signals=None):
+        self.settings = settings or Settings()
+        self.stats = stats
+        self.signals = signals
+        self.storage = None
+        self.instruments = None
+        self.writer = None
+        self.stored_dates = {}
+        # price file => Deferreds of the items waiting for the stored dates
+        self.loading = {}
+        self.changed_instruments = set()
+        self.base_directory = None
+        self.columnar_directory = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings, crawler.stats, crawler.signals)
+
+    def open_spider(self, spider):
+        """
+        Called upon creating the spider
+        """
+        dir_name = output_directory_name(spider.name)
+        self.base_directory = f"{spider.base_dir}/{dir_name}"
+        backend = storage_backend(self.settings)
+        self.storage = backend(self.base_directory, dir_name, self.settings, self.stats)
+        self.instruments = instrument_registry(spider)
+        if self.settings.getbool("PRICE_EXPORT_COLUMNAR"):
+            columnar_dir = self.settings.get("PRICE_EXPORT_COLUMNAR_DIR") or f"{spider.base_dir}/columnar"
+            self.columnar_directory = f"{columnar_dir}/{dir_name}"
+        spider.known_dates = KnownDates(self, self.stats)
+        if self.settings.getbool("ASYNC_OUTPUT_ENABLED"):
+            self.writer = BackgroundWriter(
+                "price-exporter",
+                self.settings.getint("ASYNC_OUTPUT_QUEUE_SIZE"),
+                self.stats
+            )
+        else:
+            # the items of a finished callback are stored before the storage commits
+            self.storage.on_commit = self._prices_committed
+
+    def close_spider(self, spider):
+        """
+        Called upon closing the spider
+        """
+        if self.writer:
+            self.writer.call(self.storage.close)
+            self.writer.close()
+        else:
+            self.storage.close()
+        self.storage.publish_stats()
+        self._prices_committed()
+        self._report_date_index(spider)
+        if self.columnar_directory:
+            for file in self.changed_instruments:
+                convert_json(file.json_path, f"{self.columnar_directory}/{file.name}.ppc")
+
+    def _prices_committed(self):
+        if self.signals is not None:
+            self.signals.send_catch_log(signal=prices_committed)
+
+    def process_item(self, item, spider):
+        """
+        Exports price and date information to json files based on the passed name
+        """
+        if isinstance(item, PortfolioPerformancePriceSeries):
+            file = self.instruments.resolve(item).file
+            process = self._process_series
+        else:
+            file = self.instruments.resolve(ItemAdapter(item)).file
+            process = self._process_price
+        if not self._load_file(file):
+            return self._wait_for_file(file).addCallback(lambda _: process(item, file, spider))
+        return process(item, file, spider)
+
+    def _process_price(self, item, file, spider):
+        """
+        Exports a single price if it is not yet stored
+        """
+        adapter = ItemAdapter(item)
+        adapter["date"] = normalize_date(adapter["date"])
+        if adapter["date"] in self.stored_dates[file]:
+            spider.logger.debug("Ignored item because it is already stored")
+            return item
+        self.stored_dates[file].add(adapter["date"])
+        self.changed_instruments.add(file)
+        if self.writer:
+            deferred = self.writer.submit(self.storage.store, file, item)
+            if deferred is not None:
+                return deferred.addCallback(lambda _: item)
+            return item
+        self.storage.store(file, item)
+        return item
+
+    def _process_series(self, item, file, spider):
+        """
+        Exports the not yet stored prices of a price series
+        """
+        stored_dates = self.stored_dates[file]
+        rows = []
+        for row in price_rows(item):
+            row["date"] = normalize_date(row["date"])
+            if row["date"] in stored_dates:
+                continue
+            stored_dates.add(row["date"])
+            rows.append(row)
+        spider.logger.debug("Storing %d of %d prices of %s", len(rows), len(item["dates"]), file.name)
+        if self.stats is not None:
+            self.stats.inc_value("price_exporter/series_rows", len(item["dates"]))
+            self.stats.inc_value("price_exporter/series_rows_stored", len(rows))
+        if not rows:
+            return item
+        self.changed_instruments.add(file)
+        if self.writer:
+            deferred = self.writer.submit(self.storage.store_many, file, rows)
+            if deferred is not None:
+                return deferred.addCallback(lambda _: item)
+            return item
+        self.storage.store_many(file, rows)
+        return item
+
+    def is_stored(self, file_name, date):
+        """
+        Checks if the price of the instrument is already stored for the date
+        """
+        # only the price file is looked up, no instrument record is created for the file name
+        file = self.instruments.file(file_name)
+        if not self._load_file(file):
+            # the pipeline drops the duplicates once the dates are loaded
+            return False
+        return date in self.stored_dates[file]
+
+    def _load_file(self, file):
+        """
+        Stores the already persisted dates for a particular price file. Returns False
+        while they are loaded on the writer thread, see `_wait_for_file`.
+        """
+        if file in self.stored_dates:
+            return True
+        if self.writer is None or self.storage.concurrent_load:
+            # nothing of the instrument is queued before its dates are loaded
+            self.stored_dates[file] = self._create_date_index(file)
+            return True
+        if file not in self.loading:
+            self.loading[file] = []
+            self.writer.defer(self._create_date_index, file).addBoth(self._file_loaded, file)
+        return False
+
+    def _wait_for_file(self, file):
+        """
+        Returns a Deferred which fires when the dates of the file are loaded
+        """
+        deferred = Deferred()
+        self.loading[file].append(deferred)
+        return deferred
+
+    def _file_loaded(self, result, file):
+        waiting = self.loading.pop(file)
+        if isinstance(result, Failure):
+            for deferred in waiting:
+                deferred.errback(result)
+            return None
+        self.stored_dates[file] = result
+        for deferred in waiting:
+            deferred.callback(None)
+        return None
+
+    def _create_date_index(self, file):
+        return DateIndex(self.storage.load_dates(file))
+
+    def _report_date_index(self, spider):
+        """
+        Reports the size of the date indexes in the stats and in the log
+        """
+        dates = sum(len(index) for index in self.stored_dates.values())
+        memory = sum(index.memory_usage() for index in self.stored_dates.values())
+        if self.stats is not None:
+            self.stats.set_value("price_exporter/date_index_instruments", len(self.stored_dates))
+            self.stats.set_value("price_exporter/date_index_dates", dates)
+            self.stats.set_value("price_exporter/date_index_bytes", memory)
+        spider.logger.info("Date index: %d instruments, %d dates, %d bytes",
+            len(self.stored_dates),
+            dates,
+            memory
+        )
@@ -0,0 +1,56 @@
+import math
+from json.encoder import encode_basestring_ascii
+
+from scrapy.utils.serialize import ScrapyJSONEncoder
+
+EXPORTED_FIELDS = ['price', 'date', 'volume', 'day_low', 'day_high']
+
+
+class PriceJsonExporter:
+    """
+    Specialized json exporter of price rows.
+
+    It writes the same bytes as `JsonItemExporter(file, indent=True,
+    fields_to_export=EXPORTED_FIELDS)` but the field names and the formatting
+    come from precomputed templates and only the values are encoded.
+    Plain floats, ints and strings are encoded directly, every other value
+    goes through the scrapy json encoder.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.first_item = True
+        self.encoder = ScrapyJSONEncoder(indent=True, ensure_ascii=True)
+        self.templates = [(field, f' "{field}": ') for field in EXPORTED_FIELDS]
+
+    def start_exporting(self):
+        self.file.write(b"[\n")
+
+    def finish_exporting(self):
+        self.file.write(b"\n]")
+
+    def export_item(self, item):
+        members = [
+            template + self.encode_value(item[field])
+            for field, template in self.templates
+            if field in item
+        ]
+        row = "{\n" + ",\n".join(members) + "\n}" if members else "{}"
+        if self.first_item:
+            self.first_item = False
+            self.file.write(row.encode("ascii"))
+        else:
+            self.file.write(b",\n" + row.encode("ascii"))
+
+    def encode_value(self, value):
+        """
+        Returns the json representation of a single value
+        """
+        value_type = type(value)
+        if value_type is float and math.isfinite(value):
+            return float.__repr__(value)
+        if value_type is str:
+            return encode_basestring_ascii(value)
+        if value_type is int:
+            return int.__repr__(value)
+        return self.encoder.encode(value)
@@ -15,6 +15,10 @@ NEWSPIDER_MODULE = "price_scraper.spiders"
 SPLASH_URL = 'http://0.0.0.0:8050'
 DUPEFILTER_CLASS = 'scrapy_splash.SplashAwareDupeFilter'
 HTTPCACHE_STORAGE = 'scrapy_splash.SplashAwareFSCacheStorage'
+# Splash instances used by the session pool of the bamosz historical scraping, defaults to SPLASH_URL
+SPLASH_URLS = []
+# Number of isolated Splash sessions which scrape bamosz historical data in parallel
+BAMOSZ_SPLASH_SESSIONS = 4
 
 # Crawl responsibly by identifying yourself (and your website) on the user-agent
 USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36'
@@ -49,18 +53,38 @@ ROBOTSTXT_OBEY = False
 # See https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 SPIDER_MIDDLEWARES = {
     'scrapy_splash.SplashDeduplicateArgsMiddleware': 100,
+    "price_scraper.middlewares.BusinessDayMiddleware": 50,
 #    "price_scraper.middlewares.PriceScraperSpiderMiddleware": 543,
 }
 
+# Skip the runs of the daily spiders when neither today nor the previous
+# BUSINESS_DAY_PUBLICATION_LAG days are Hungarian business days
+SKIP_NON_BUSINESS_DAYS = False
+BUSINESS_DAY_PUBLICATION_LAG = 1
+
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 DOWNLOADER_MIDDLEWARES = {
 #    "price_scraper.middlewares.PriceScraperDownloaderMiddleware": 543,
+    # after CookiesMiddleware (700), so a dropped 304 response never reaches the cookie jar, and
+    # before HttpCompressionMiddleware (810) and HttpCacheMiddleware (900), so the stored size is
+    # the decompressed body and a response served from the http cache is recorded like a download
+    "price_scraper.middlewares.ConditionalRequestMiddleware": 710,
     'scrapy_splash.SplashCookiesMiddleware': 723,
     'scrapy_splash.SplashMiddleware': 725,
+    "price_scraper.middlewares.ContentHashMiddleware": 750,
     'scrapy.downloadermiddlewares.httpcompression.HttpCompressionMiddleware': 810,
 }
 
+# Send the validators of the previous run and skip the callback of 304 Not Modified responses.
+# Validators are stored per spider and output directory in the .scrapy data directory
+CONDITIONAL_REQUESTS_ENABLED = True
+CONDITIONAL_REQUESTS_DIR = "conditional_requests"
+# Drop responses of requests marked with the `skip_unchanged` meta key when their body
+# is identical to the previous run's one
+CONTENT_HASH_ENABLED = True
+CONTENT_HASH_DIR = "content_hashes"
+
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
 #EXTENSIONS = {
@@ -74,6 +98,76 @@ ITEM_PIPELINES = {
     "price_scraper.price_exporter_pipeline.PriceExporterPipeline": 300,
 }
 
+# Date range spiders request only the days after the last stored date of their instruments,
+# the `start_date` spider argument overrides it
+WATERMARK_ENABLED = True
+# Number of days requested again before the watermark
+WATERMARK_OVERLAP_DAYS = 3
+# Instruments behind the newest one of their source by more days are ignored (e.g. discontinued portfolios)
+WATERMARK_STALE_DAYS = 30
+
+# Write the price files of the price exporter pipeline on a background writer thread,
+# a full queue applies backpressure to the item processing
+ASYNC_OUTPUT_ENABLED = False
+ASYNC_OUTPUT_QUEUE_SIZE = 10000
+
+# Storage backend of the price exporter pipeline: "json" or "sqlite"
+# The sqlite backend regenerates the json files of the changed instruments on close
+PRICE_STORAGE_BACKEND = "json"
+# Relative paths are resolved inside the .scrapy data directory. Every base_dir has
+# its own database, the digest of the directory is appended to the file name
+PRICE_STORAGE_SQLITE_PATH = "prices.sqlite"
+PRICE_STORAGE_SQLITE_BATCH_SIZE = 1000
+# Maximum number of price files kept open by the "append" commit mode,
+# the least recently used file is closed when the limit is reached
+PRICE_EXPORTER_POOL_SIZE = 128
+# How the json backend commits new prices:
+# "append" writes every item directly into the open files,
+# "batched" buffers them in memory and atomically rewrites the files on flush,
+# "journal" appends them to per instrument journals which are merged at checkpoints
+PRICE_EXPORT_COMMIT_MODE = "append"
+# A batched flush happens when either of the buffered item count or size is reached
+PRICE_EXPORT_FLUSH_ITEMS = 10000
+PRICE_EXPORT_FLUSH_BYTES = 16 * 1024 * 1024
+# Number of journaled items after which the journals are merged into the json files
+PRICE_EXPORT_CHECKPOINT_ITEMS = 10000
+# When to fsync the atomically replaced files: "never", "close" or "always"
+PRICE_EXPORT_FSYNC = "close"
+# Encoder of the price rows: "scrapy" uses JsonItemExporter,
+# "fast" writes the same bytes from precomputed templates
+PRICE_EXPORTER_WRITER = "scrapy"
+# Export the changed instruments into the columnar binary format as well,
+# the files are written into <PRICE_EXPORT_COLUMNAR_DIR or base_dir/columnar>/<spider>/<name>.ppc
+PRICE_EXPORT_COLUMNAR = False
+PRICE_EXPORT_COLUMNAR_DIR = None
+
+# Number of worker processes of the PDF OCR, defaults to the number of cores
+OCR_POOL_SIZE = None
+# Text extraction of the PDFs: "ocr" always OCRs, "text" uses the text layer and falls back
+# to OCR for pages with less than OCR_TEXT_LAYER_MIN_CHARS characters. The parsing of the
+# reports is tuned to the tesseract output, "text" is not yet checked against real reports
+OCR_MODE = "ocr"
+OCR_TEXT_LAYER_MIN_CHARS = 20
+# Rendering resolution and tesseract language of the PDF OCR
+OCR_DPI = 200
+OCR_LANG = "eng"
+# Preprocessing of the rendered pages: grayscale rendering, crop to the table region given as
+# [left, top, right, bottom] fractions of the page, Otsu binarization and deskew up to the given degrees
+OCR_GRAYSCALE = True
+OCR_CROP = None
+OCR_BINARIZE = True
+OCR_DESKEW_MAX_ANGLE = 2.0
+# Cache the OCR text of the PDFs under .scrapy/<OCR_CACHE_DIR>, the least recently
+# used entries are removed over OCR_CACHE_MAX_SIZE bytes
+OCR_CACHE_ENABLED = True
+OCR_CACHE_DIR = "ocr_cache"
+OCR_CACHE_MAX_SIZE = 256 * 1024 * 1024
+
+# The historical report spiders record the completed reports under .scrapy/<BACKFILL_CHECKPOINT_DIR>
+# and schedule the date range in chunks of BACKFILL_CHUNK_DAYS days
+BACKFILL_CHECKPOINT_DIR = "backfill"
+BACKFILL_CHUNK_DAYS = 31
+
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
 #AUTOTHROTTLE_ENABLED = True
@@ -9,6 +9,7 @@ from scrapy.http import Response
 
 from dateutil.relativedelta import relativedelta
 from price_scraper.items import PortfolioPerformanceHistoricalPrice
+from price_scraper.watermark import watermark_start_date
 
 class AlfaVPFSpider(scrapy.Spider):
     """
@@ -20,6 +21,7 @@ class AlfaVPFSpider(scrapy.Spider):
     """
 
     name = 'alfa_nyugdij'
+    business_days_only = True
     bond_id_mapping = {
         '13': 'Klasszikus',
         '14': 'Kiegyensúlyozott',
@@ -31,10 +33,9 @@ class AlfaVPFSpider(scrapy.Spider):
 
     def start_requests(self):
         end_date = datetime.date.today()
-        # default scrape interval is current month-2 months just to be safe to not to miss anything
-        curr_date = end_date - relativedelta(months=2)
-        # this date range can be used for historical querying
-        #curr_date = datetime.date(2015, 10, 1)
+        # default scrape interval without stored history is current month-2 months
+        # for historical querying pass `-a start_date=2015-10-01`
+        curr_date = watermark_start_date(self, end_date - relativedelta(months=2))
         yield scrapy.FormRequest(
             url='https://www.alfanyugdij.hu/wp-admin/admin-ajax.php',
             callback=self.parse,
@@ -8,7 +8,9 @@ import scrapy
 from scrapy.http import Response
 
 from dateutil.relativedelta import relativedelta
-from price_scraper.items import PortfolioPerformanceHistoricalPrice
+from price_scraper.items import price_series
+from price_scraper.tables import extract_table
+from price_scraper.watermark import watermark_start_date
 
 class AllianzVPFSpider(scrapy.Spider):
     """
@@ -19,50 +21,42 @@ class AllianzVPFSpider(scrapy.Spider):
     """
 
     name = "allianz_nyugdij"
+    business_days_only = True
 
     def start_requests(self):
         end_date = datetime.date.today()
-        start_date = end_date - relativedelta(days=20)
-        # for historical generation
-        # start_date = datetime.date(2008, 1, 1)
+        # for historical generation pass `-a start_date=2008-01-01`
+        start_date = watermark_start_date(self, end_date - relativedelta(days=20))
         # pylint: disable=line-too-long
         url = f'https://penztar.allianz.hu/web_graf/Graf_tabla.php?kezdes={start_date.strftime("%Y%m%d")}&vege={end_date.strftime("%Y%m%d")}'
-        yield scrapy.Request(url=url, callback=self.parse)
+        # the date range changes daily so the response is compared by a fixed key
+        yield scrapy.Request(url=url, callback=self.parse, meta={'skip_unchanged': 'Graf_tabla'})
 
     def parse(self, response: Response, **kwargs: Any):
         """
         Parses portfolios from the response which is a complete page.
         """
-        table = response.css('tr')
-        if not table:
+        portfolios, rows = extract_table(response, 'tr', header_row=4, drop_empty=True)
+        if portfolios is None:
             return None
-
-        portfolios = [r.css('::text').get() for r in table[4].css('td')]
-        portfolios = AllianzVPFSpider.sanitize_table_columns(portfolios)
         # strip the first element because that is not needed
-        portfolios = portfolios[1:]
-
-        for row in table[5:]:
-            row_datas = [r.css('::text').get() for r in row.css('td')]
-            row_datas = AllianzVPFSpider.sanitize_table_columns(row_datas)
+        series = [
+            price_series(
+                file_name=portfolio.split(' ')[0],
+                security_name=f"Allianz Önkéntes Pénztárak {portfolio}",
+                currency="HUF",
+                ticker_symbol=f"ALLÖNYP_{portfolio[:5].upper()}"
+            )
+            for portfolio in portfolios[1:]
+        ]
+
+        for row_datas in rows:
             if not row_datas:
                 continue
             date = row_datas[0].replace('.', '-')
             for idx, data in enumerate(row_datas[1:]):
-                portfolio = portfolios[idx]
-                price = float(data.replace(',', '.'))
-                yield PortfolioPerformanceHistoricalPrice(
-                        file_name=portfolio.split(' ')[0],
-                        date=date,
-                        price=price,
-                        security_name=f"Allianz Önkéntes Pénztárak {portfolio}",
-                        currency="HUF",
-                        ticker_symbol=f"ALLÖNYP_{portfolio[:5].upper()}"
-                    )
-
-    @staticmethod
-    def sanitize_table_columns(columns):
-        """
-        Removes empty and \xa0 elements in the array.
-        """
-        return list(filter(lambda c: c and c != '\xa0', columns))
+                series[idx]['dates'].append(date)
+                series[idx]['prices'].append(float(data.replace(',', '.')))
+        for portfolio_series in series:
+            if portfolio_series['dates']:
+                yield portfolio_series
@@ -6,7 +6,10 @@ from typing import Any
 import scrapy
 from scrapy.http import Response
 
-from price_scraper.items import PortfolioPerformanceHistoricalPrice
+from price_scraper.items import price_series
+from price_scraper.known_dates import is_known_date
+from price_scraper.tables import extract_table
+from price_scraper.watermark import watermark_start_date
 
 class AranykorSpider(scrapy.Spider):
     """
@@ -24,26 +27,33 @@ class AranykorSpider(scrapy.Spider):
 
         while datetime.date(req_year, req_month, 1) <= today:
             url = f"https://www.aranykornyp.hu/public/arfolyamok/archivum/{req_year}-{req_month}"
-            yield scrapy.Request(url=url, callback=self.parse)
+            yield scrapy.Request(url=url, callback=self.parse, meta={'skip_not_modified': True})
             req_month += 1
             if req_month > 12:
                 req_month = 1
                 req_year += 1
 
     def parse(self, response: Response, **kwargs: Any):
-        header = response.css("tr")[0].css("th::text").getall()
-        for line in response.css("tr")[1:]:
-            prices = line.css("td::text").getall()
-            date = prices[1]
-            for idx, portfolio in enumerate(header, 2):
-                yield PortfolioPerformanceHistoricalPrice(
-                    file_name=portfolio,
-                    date=date.replace('.', '-'),
-                    price=float(prices[idx]),
-                    security_name=f"Aranykor {portfolio}",
-                    currency="HUF",
-                    ticker_symbol=f"ARANY_{portfolio[:5].upper()}"
-                )
+        header, rows = extract_table(response, "tr", header_cells="th", text="direct")
+        if not header:
+            return
+        series = [
+            price_series(
+                file_name=portfolio,
+                security_name=f"Aranykor {portfolio}",
+                currency="HUF",
+                ticker_symbol=f"ARANY_{portfolio[:5].upper()}"
+            )
+            for portfolio in header
+        ]
+        for prices in rows:
+            date = prices[1].replace('.', '-')
+            for idx, portfolio_series in enumerate(series, 2):
+                portfolio_series['dates'].append(date)
+                portfolio_series['prices'].append(float(prices[idx]))
+        for portfolio_series in series:
+            if portfolio_series['dates']:
+                yield portfolio_series
 
 class AranykorSpiderv2(scrapy.Spider):
     """
@@ -56,12 +66,15 @@ class AranykorSpiderv2(scrapy.Spider):
 
     def start_requests(self):
         today = datetime.date.today()
+        start_date = watermark_start_date(self, datetime.date(2014, 7, 1))
 
-        url = f"https://op-api.aranykornyp.hu/stock-rate/graph/2014-07-01/{today.strftime('%Y-%m-%d')}"
+        url = f"https://op-api.aranykornyp.hu/stock-rate/graph/{start_date.strftime('%Y-%m-%d')}/{today.strftime('%Y-%m-%d')}"
         yield scrapy.Request(url=url, callback=self.parse)
 
     def parse(self, response: Response, **kwargs: Any):
         data = response.json()
+        # portfolio => price series
+        series = {}
         for  day in data:
             date = datetime.datetime.fromisoformat(day["erteknap"]).date().strftime('%Y-%m-%d')
             # remove this element as we want to iterate over the portfolios
@@ -72,18 +85,22 @@ class AranykorSpiderv2(scrapy.Spider):
                 if price == 0.0:
                     continue
                 portfolio = self.map_portfolio(key)
-                if portfolio.startswith("Postás"):
-                    ticker_symbol = portfolio[:10]
-                else:
-                    ticker_symbol = portfolio[:5]
-                yield PortfolioPerformanceHistoricalPrice(
-                    file_name=portfolio,
-                    date=date,
-                    price=price,
-                    security_name=f"Aranykor {portfolio}",
-                    currency="HUF",
-                    ticker_symbol=f"ARANY_{ticker_symbol.upper()}"
-                )
+                if is_known_date(self, portfolio, date):
+                    continue
+                if portfolio not in series:
+                    if portfolio.startswith("Postás"):
+                        ticker_symbol = portfolio[:10]
+                    else:
+                        ticker_symbol = portfolio[:5]
+                    series[portfolio] = price_series(
+                        file_name=portfolio,
+                        security_name=f"Aranykor {portfolio}",
+                        currency="HUF",
+                        ticker_symbol=f"ARANY_{ticker_symbol.upper()}"
+                    )
+                series[portfolio]['dates'].append(date)
+                series[portfolio]['prices'].append(price)
+        yield from series.values()
 
     @staticmethod
     def map_portfolio(portfolio):
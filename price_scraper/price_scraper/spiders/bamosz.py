@@ -2,27 +2,57 @@
 Scraper for Bamosz listed funds
 """
 
+from collections import deque
 from functools import partial
 from typing import Any
 import scrapy
-from scrapy.http import Response
+from scrapy.http import FormRequest, Response
+from scrapy.selector import Selector
+from lxml import etree
 import scrapy_splash
 
-from price_scraper.items import PortfolioPerformanceHistoricalPrice
+from price_scraper.items import PortfolioPerformanceHistoricalPrice, price_series
+from price_scraper.tables import cell_texts, select, table_rows
+
+# renders a page in a Splash session and returns its cookies, so the
+# SplashCookiesMiddleware keeps a separate cookie jar for every session_id
+SPLASH_SESSION_SCRIPT = """
+function main(splash, args)
+    splash:init_cookies(args.cookies)
+    assert(splash:go{args.url, headers=args.headers, http_method=args.http_method, body=args.body})
+    assert(splash:wait(args.wait))
+    return {html=splash:html(), url=splash:url(), cookies=splash:get_cookies()}
+end
+"""
 
 class BamoszSpider(scrapy.Spider):
     """
     Scrapes Bamosz website for daily hungarian fund prices
 
     Base URL: https://www.bamosz.hu/legfrissebb-adatok
+
+    Historical data is scraped with `-a scrape_historical_data=True`. The default
+    `historical_mode=splash` renders the fund pages with Splash, `historical_mode=jsf`
+    replays the JSF form submission with plain requests.
+
+    In splash mode the funds are distributed over `BAMOSZ_SPLASH_SESSIONS` isolated
+    Splash sessions which are spread over the `SPLASH_URLS` instances. A session
+    processes its queue one fund at a time, because the JSF state of a session
+    breaks when its requests interleave.
     """
 
     name = "bamosz"
+    business_days_only = True
     start_urls = ["https://www.bamosz.hu/legfrissebb-adatok"]
 
-    def __init__(self, *args, scrape_historical_data=False, **kwargs):
+    # form of the fund page which requests the historical prices
+    historical_form_id = 'A3225:j_idt8'
+    historical_start_date = '2024.09.01'
+
+    def __init__(self, *args, scrape_historical_data=False, historical_mode="splash", **kwargs):
         super(BamoszSpider, self).__init__(*args, **kwargs)
         self.scrape_historical_data = scrape_historical_data
+        self.historical_mode = historical_mode
 
     def parse(self, response: Response, **kwargs: Any):
         table = response.css('div[id="A6951:urlap:alapData_content"]')[0]
@@ -30,14 +60,12 @@ class BamoszSpider(scrapy.Spider):
 
         instruments = []
         for group in fund_groups:
-            rows = group.css('tr')
+            rows = select(group, 'tr')
             for idx in range(2, len(rows), 2):
-                name_row = rows[idx]
-                data_row = rows[idx + 1]
-                long_fund_name = name_row.css('a::text').getall()[0].strip()
-                isin = extract_isin(name_row.css('td').getall()[1])
-                fund_data = data_row.css('td::text').getall()
-                fund_data = sanitize_columns(fund_data)
+                long_fund_name = cell_texts(rows[idx].iter('a'), 'direct')[0].strip()
+                fund_cell = list(rows[idx].iter('td'))[1]
+                isin = extract_isin(etree.tostring(fund_cell, method='html', encoding='unicode', with_tail=False))
+                fund_data = cell_texts(rows[idx + 1].iter('td'), 'direct', strip=True)
                 currency = fund_data[1],
                 yield PortfolioPerformanceHistoricalPrice(
                     security_name=long_fund_name,
@@ -55,14 +83,36 @@ class BamoszSpider(scrapy.Spider):
                     'security_name': long_fund_name,
                 })
 
-        # you need to reduce the concurrent requests to 1
-        # you need to start splash separately with
+        # in splash mode you need to start splash separately with
         # docker run -p 8050:8050 scrapinghub/splash
         if self.scrape_historical_data:
-            for instrument in instruments:
-                yield self.get_url_for_fund_page(instrument)
+            if self.historical_mode == "jsf":
+                for instrument in instruments:
+                    yield self.get_url_for_fund_page(instrument)
+            else:
+                yield from self.start_splash_sessions(instruments)
+
+    def start_splash_sessions(self, instruments):
+        """
+        Distributes the instruments over the queues of the Splash sessions
+        and requests the first fund page of every session
+        """
+        pool_size = max(1, self.settings.getint("BAMOSZ_SPLASH_SESSIONS"))
+        self.splash_urls = self.settings.getlist("SPLASH_URLS") or [self.settings.get("SPLASH_URL")]
+        self.session_queues = [deque() for _ in range(pool_size)]
+        for idx, instrument in enumerate(instruments):
+            self.session_queues[idx % pool_size].append(instrument)
+        for session in range(pool_size):
+            yield from self.next_in_session(session)
+
+    def next_in_session(self, session):
+        """
+        Requests the fund page of the next instrument in the queue of the session
+        """
+        if self.session_queues[session]:
+            yield self.get_url_for_fund_page(self.session_queues[session].popleft(), session)
 
-    def get_url_for_fund_page(self, instrument):
+    def get_url_for_fund_page(self, instrument, session=0):
         """
         First query: https://www.bamosz.hu/legfrissebb-adatok
         then scrape ISINs and call https://www.bamosz.hu/alapoldal?isin=<isin>
@@ -71,60 +121,150 @@ class BamoszSpider(scrapy.Spider):
         https://www.bamosz.hu/web/guest/alapoldal?_bamoszpublicalapoldal_WAR_bamoszpublicalapoldalportlet_INSTANCE_N4Uk__facesViewId=/view.xhtml&p_p_col_count=2&p_p_col_id=column-1&p_p_col_pos=1&p_p_id=bamoszpublicalapoldal_WAR_bamoszpublicalapoldalportlet_INSTANCE_N4Uk&p_p_lifecycle=2&p_p_mode=view&p_p_state=normal
         """
         url = f'https://www.bamosz.hu/alapoldal?isin={instrument["isin"]}'
+        if self.historical_mode == "jsf":
+            # every fund page gets its own session, so the JSF view states do not collide
+            return scrapy.Request(
+                url=url,
+                callback=partial(self.request_historical_data_jsf, instrument),
+                meta={'cookiejar': instrument['isin']}
+            )
         return scrapy_splash.SplashRequest(
             url=url,
-            callback=partial(self.request_historical_data, instrument)
+            callback=partial(self.request_historical_data, instrument),
+            errback=self.session_failed,
+            **self.splash_session_arguments(session)
         )
 
+    def splash_session_arguments(self, session):
+        """
+        Returns the SplashRequest arguments of the requests of a session
+        """
+        return {
+            'endpoint': 'execute',
+            'args': {'lua_source': SPLASH_SESSION_SCRIPT, 'wait': 0.5},
+            'session_id': session,
+            'splash_url': self.splash_urls[session % len(self.splash_urls)],
+            'meta': {'bamosz_session': session},
+        }
+
+    def session_failed(self, failure):
+        """
+        Continues the queue of the session after a failed request
+        """
+        self.logger.error("Historical data request failed: %s", failure)
+        yield from self.next_in_session(failure.request.meta['bamosz_session'])
+
     def request_historical_data(self, instrument, response):
         """
         Creates a post rquest which requests historical data for instrument
         """
         self.logger.info("Scrapgin data for ISIN: %s", instrument['isin'])
-        request = scrapy_splash.SplashFormRequest.from_response(
+        session = response.meta['bamosz_session']
+        request = None
+        try:
+            # the selector of a Splash json response has no base url to resolve the form action
+            action = response.css(f'form[id="{self.historical_form_id}"]::attr(action)').get()
+            request = scrapy_splash.SplashFormRequest.from_response(
+                response,
+                url=response.urljoin(action) if action else response.url,
+                formid=self.historical_form_id,
+                formdata={
+                    f'{self.historical_form_id}:startDate_input': self.historical_start_date,
+                },
+                callback=partial(self.parse_session_historical_data, instrument),
+                errback=self.session_failed,
+                **self.splash_session_arguments(session)
+            )
+        except ValueError:
+            self.logger.error("No historical data form on the fund page of ISIN: %s", instrument['isin'])
+        finally:
+            # without a form request the session continues with its next fund
+            if request is None:
+                yield from self.next_in_session(session)
+        if request is not None:
+            yield request
+
+    def request_historical_data_jsf(self, instrument, response):
+        """
+        Replays the ajax submission of the historical data form without a browser.
+        The form fields and the `javax.faces.ViewState` come from the plain HTML page.
+        """
+        form_id = self.historical_form_id
+        form = response.css(f'form[id="{form_id}"]')
+        source = form.css('button[type="submit"]::attr(name), input[type="submit"]::attr(name)').get()
+        if not source or not form.css('input[name="javax.faces.ViewState"]'):
+            self.logger.error("No JSF form on the fund page of ISIN: %s", instrument['isin'])
+            return
+        self.logger.info("Scraping data for ISIN: %s", instrument['isin'])
+        yield FormRequest.from_response(
             response,
-            formid='A3225:j_idt8',
+            formid=form_id,
             formdata={
-                'A3225:j_idt8:startDate_input': '2024.09.01',
+                f'{form_id}:startDate_input': self.historical_start_date,
+                'javax.faces.partial.ajax': 'true',
+                'javax.faces.source': source,
+                'javax.faces.partial.execute': '@all',
+                'javax.faces.partial.render': form_id,
+                source: source,
+            },
+            dont_click=True,
+            headers={
+                'Faces-Request': 'partial/ajax',
+                'X-Requested-With': 'XMLHttpRequest',
             },
-            callback=partial(self.parse_historical_data, instrument)
+            meta={'cookiejar': instrument['isin']},
+            callback=partial(self.parse_partial_response, instrument)
         )
-        yield request
+
+    def parse_partial_response(self, instrument, response):
+        """
+        Parses historical data from the updated fragments of a JSF partial response
+        """
+        updates = Selector(text=response.text, type='xml').xpath(
+            '//update[not(contains(@id, "javax.faces.ViewState"))]/text()'
+        ).getall()
+        if not updates:
+            self.logger.error("Empty partial response for ISIN: %s", instrument['isin'])
+            return
+        yield from self.parse_historical_data(instrument, Selector(text=''.join(updates)))
+
+    def parse_session_historical_data(self, instrument, response):
+        """
+        Parses historical data rendered by a Splash session and continues its queue,
+        also when the parsing fails
+        """
+        try:
+            yield from self.parse_historical_data(instrument, response)
+        finally:
+            yield from self.next_in_session(response.meta['bamosz_session'])
 
     def parse_historical_data(self, instrument, response):
         """
         Parses historical data for an instrument from the response
         """
         # we have 2 tables one is hidden because of ajax craziness
-        table = response.css('table.dataTable2')[-1]
-        rows = table.css('tr')
+        tables = response.css('table.dataTable2')
+        if not tables:
+            self.logger.error("No historical data table for ISIN: %s", instrument['isin'])
+            self.crawler.stats.inc_value("bamosz/historical_table_missing")
+            return
+        table = tables[-1]
+        series = price_series(
+            security_name=instrument['security_name'],
+            file_name=instrument['isin'],
+            currency=instrument['currency'],
+            isin=instrument['isin'],
+        )
         # first line headers
-        for row in rows[1:]:
-            data = sanitize_columns(row.css('td::text').getall())
+        for data in table_rows(table, 'tr', text='direct', strip=True)[1:]:
             # sometimes there is no price on certain dates
             if not data[1]:
                 continue
-            yield PortfolioPerformanceHistoricalPrice(
-                security_name=instrument['security_name'],
-                file_name=instrument['isin'],
-                # it has a trailing dot in the date but we shouldn't remove it
-                date=data[0].replace('.', '-')[:-1],
-                price=float(data[1].replace(',', '.')),
-                currency=instrument['currency'],
-                isin=instrument['isin'],
-            )
-
-def sanitize_columns(columns):
-    """
-    Trims whitespaces and removes newlines
-    """
-    data = []
-    for column in columns:
-        column = column.strip()
-        column = column.replace('\xa0', '')
-        data.append(column)
-
-    return data
+            # it has a trailing dot in the date but we shouldn't remove it
+            series['dates'].append(data[0].replace('.', '-')[:-1])
+            series['prices'].append(float(data[1].replace(',', '.')))
+        if series['dates']:
+            yield series
 
 def extract_isin(input_data: str):
     """
@@ -7,6 +7,7 @@ import scrapy
 from scrapy.http import Response
 
 from price_scraper.items import PortfolioPerformanceHistoricalPrice
+from price_scraper.watermark import watermark_start_date
 
 class BudapestPFSpider(scrapy.Spider):
     """
@@ -16,18 +17,20 @@ class BudapestPFSpider(scrapy.Spider):
     """
 
     name = "budapest_nyugdij"
+    business_days_only = True
 
     def start_requests(self):
         end_date = datetime.date.today()
-        start_date = end_date - datetime.timedelta(days=32)
+        start_date = watermark_start_date(self, end_date - datetime.timedelta(days=32))
         start_date = start_date.strftime("%Y%m%d")
         end_date = end_date.strftime("%Y%m%d")
         # pylint: disable=line-too-long
         url = f"https://www.mbhbank.hu/apps/backend/exchange-rate/exchange-rate-voluntary?active=true&secure=true&fromDate={start_date}&toDate={end_date}"
-        yield scrapy.Request(url=url, callback=self.parse)
+        # the date range changes daily so the responses are compared by a fixed key
+        yield scrapy.Request(url=url, callback=self.parse, meta={'skip_unchanged': 'exchange-rate-voluntary'})
         # pylint: disable=line-too-long
         url = f"https://www.mbhbank.hu/apps/backend/exchange-rate/exchange-rate-personal?growth=true&balanced=true&classic=true&fromDate={start_date}&toDate={end_date}"
-        yield scrapy.Request(url=url, callback=self.parse)
+        yield scrapy.Request(url=url, callback=self.parse, meta={'skip_unchanged': 'exchange-rate-personal'})
 
     def parse(self, response: Response, **kwargs: Any):
         data = response.json()
@@ -6,7 +6,9 @@ from typing import Any
 import scrapy
 from scrapy.http import Response
 
-from price_scraper.items import PortfolioPerformanceHistoricalPrice
+from price_scraper.items import PortfolioPerformanceHistoricalPrice, price_series
+from price_scraper.known_dates import is_known_date
+from price_scraper.tables import cell_texts, select
 
 class ErsteVPFSpider(scrapy.Spider):
     """
@@ -18,12 +20,18 @@ class ErsteVPFSpider(scrapy.Spider):
     """
 
     name = "erste_nyugdij"
+    business_days_only = True
     start_urls = ["https://www.erstenyugdijpenztar.hu/tagiportal/hu/arfolyamok.html"]
 
     def __init__(self, *args, csv_data=None, **kwargs):
         super(ErsteVPFSpider, self).__init__(*args, **kwargs)
         self.csv_data = csv_data
 
+    def start_requests(self):
+        # the hand-crafted csv is exported from the callback regardless of the page
+        for url in self.start_urls:
+            yield scrapy.Request(url, dont_filter=True, meta={'skip_not_modified': not self.csv_data})
+
     def parse(self, response: Response, **kwargs: Any):
         """
         Parses portfolios from the response which is a complete page.
@@ -35,29 +43,33 @@ class ErsteVPFSpider(scrapy.Spider):
                 yield item
             return
 
-        table = response.css('table.arfolyamTable')
-        if not table:
+        if not response.css('table.arfolyamTable'):
             return None
 
-        headers = table.css('thead').css('tr')[1].css('th')
-        headers = [header.css('::text').get() for header in headers]
+        headers = cell_texts(select(response, 'table.arfolyamTable thead tr')[1].iter('th'))
         portfolios = [header for header in headers if header]
-        for row in table.css('tbody').css('tr'):
-            prices = [r.css('::text').get() for r in row.css('td')]
-            date = row.css('th::text').get()
+        series = [
+            price_series(
+                file_name=portfolio.split(' ')[0],
+                security_name=f"Erste Nyugdíjpénztár {portfolio} portfólió",
+                currency="HUF",
+                ticker_symbol=f"ERÖNYP_{portfolio[:5].upper()}"
+            )
+            for portfolio in portfolios
+        ]
+        for row in select(response, 'table.arfolyamTable tbody tr'):
+            date = cell_texts(row.iter('th'), 'direct')[0].replace('.', '-')
+            prices = cell_texts(row.iter('td'))
             for idx, data in enumerate(prices):
                 if not data:
                     continue
-                portfolio = portfolios[idx]
-                price = float(data.replace(',', '.'))
-                yield PortfolioPerformanceHistoricalPrice(
-                        file_name=portfolio.split(' ')[0],
-                        date=date.replace('.', '-'),
-                        price=price,
-                        security_name=f"Erste Nyugdíjpénztár {portfolio} portfólió",
-                        currency="HUF",
-                        ticker_symbol=f"ERÖNYP_{portfolio[:5].upper()}"
-                    )
+                if is_known_date(self, series[idx]['file_name'], date):
+                    continue
+                series[idx]['dates'].append(date)
+                series[idx]['prices'].append(float(data.replace(',', '.')))
+        for portfolio_series in series:
+            if portfolio_series['dates']:
+                yield portfolio_series
 
     def parse_csv(self, path):
         """
@@ -75,6 +87,8 @@ class ErsteVPFSpider(scrapy.Spider):
                     if not column:
                         continue
                     portfolio = portfolios[idx]
+                    if is_known_date(self, portfolio, date):
+                        continue
                     yield PortfolioPerformanceHistoricalPrice(
                             file_name=portfolio,
                             date=date,
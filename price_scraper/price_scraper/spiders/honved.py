@@ -7,7 +7,9 @@ import scrapy
 from scrapy.http import Response
 
 from dateutil.relativedelta import relativedelta
-from price_scraper.items import PortfolioPerformanceHistoricalPrice
+from price_scraper.items import price_series
+from price_scraper.tables import extract_table
+from price_scraper.watermark import watermark_start_date
 
 class HonvedVPFSpider(scrapy.Spider):
     """
@@ -19,13 +21,13 @@ class HonvedVPFSpider(scrapy.Spider):
     """
 
     name = 'honved_nyugdij'
+    business_days_only = True
 
     def start_requests(self):
         end_date = datetime.date.today()
-        # default scrape interval is current month-2 months just to be safe to not to miss anything
-        curr_date = end_date - relativedelta(months=2)
-        # this date range can be used for historical querying
-        # curr_date = datetime.date(2008, 1, 1)
+        # default scrape interval without stored history is current month-2 months
+        # for historical querying pass `-a start_date=2008-01-01`
+        curr_date = watermark_start_date(self, end_date - relativedelta(months=2))
         yield scrapy.FormRequest(
             url='https://hnyp.hu/arfolyamok',
             callback=self.parse,
@@ -44,26 +46,28 @@ class HonvedVPFSpider(scrapy.Spider):
         """
         Parses portfolios from the response which is a complete page.
         """
-        table = response.css('td.cikk').css('tr')
-        if not table:
+        portfolios, rows = extract_table(response, 'td.cikk tr')
+        if portfolios is None:
             return None
         # strip the first element because that is not needed
-        portfolios = [r.css('::text').get() for r in table[0].css('td')][1:]
+        series = [
+            price_series(
+                file_name=portfolio.split(' ')[0],
+                security_name=f"Honvéd Közszolgálati Önkéntes Nyugdíjpénztár {portfolio}",
+                currency="HUF",
+                ticker_symbol=f"HONÖNYP_{portfolio[:5].upper()}"
+            )
+            for portfolio in portfolios[1:]
+        ]
 
-        for row in table[1:]:
-            row_datas = [r.css('::text').get() for r in row.css('td')]
+        for row_datas in rows:
             if not row_datas:
                 continue
 
             date = row_datas[0].replace('.', '-')
             for idx, data in enumerate(row_datas[1:]):
-                portfolio = portfolios[idx]
-                price = float(data.replace(',', '.'))
-                yield PortfolioPerformanceHistoricalPrice(
-                        file_name=portfolio.split(' ')[0],
-                        date=date,
-                        price=price,
-                        security_name=f"Honvéd Közszolgálati Önkéntes Nyugdíjpénztár {portfolio}",
-                        currency="HUF",
-                        ticker_symbol=f"HONÖNYP_{portfolio[:5].upper()}"
-                    )
+                series[idx]['dates'].append(date)
+                series[idx]['prices'].append(float(data.replace(',', '.')))
+        for portfolio_series in series:
+            if portfolio_series['dates']:
+                yield portfolio_series
@@ -8,6 +8,8 @@ from scrapy.http import Response
 
 from dateutil.relativedelta import relativedelta
 from price_scraper.items import PortfolioPerformanceHistoricalPrice
+from price_scraper.tables import cell_texts, table_rows
+from price_scraper.watermark import watermark_start_date
 
 class MbhVPFSpider(scrapy.Spider):
     """
@@ -19,11 +21,14 @@ class MbhVPFSpider(scrapy.Spider):
     """
 
     name = 'horizont_nyugdij'
+    business_days_only = True
 
     def start_requests(self):
         end_date = datetime.date.today()
-        # default scrape interval is current month-1 months just to be safe to not to miss anything
-        curr_date = end_date - relativedelta(months=1)
+        # default scrape interval without stored history is current month-1 months
+        curr_date = watermark_start_date(self, end_date - relativedelta(months=1))
+        # data is requested for whole months
+        curr_date = curr_date.replace(day=1)
         while curr_date <= end_date:
             yield scrapy.FormRequest(
                 url='https://horizontmagannyugdijpenztar.hu/arfolyamok',
@@ -39,18 +44,14 @@ class MbhVPFSpider(scrapy.Spider):
         """
         Parses portfolios from the response which is a complete page.
         """
-        table = response.css('div.rates-table').css('div.table-row')
-        if not table:
+        rows = table_rows(response, 'div.rates-table div.table-row', 'div.column', text=None)
+        if not rows:
             return None
-        headers = table[0].css('div.column')
-        portfolios = []
-        for header in headers:
-            portfolios.append(' '.join(header.css('::text').extract()))
         # strip the first element because that is not needed
-        portfolios = portfolios[1:]
+        portfolios = cell_texts(rows[0], 'joined')[1:]
 
-        for row in table[1:]:
-            row_datas = row.css('div.column::text').extract()
+        for row in rows[1:]:
+            row_datas = cell_texts(row, 'direct')
             date = row_datas[0]
             for idx, data in enumerate(row_datas[1:]):
                 portfolio = portfolios[idx]
@@ -1,16 +1,21 @@
 """
 Scraper for MAK government bonds
 """
+import asyncio
 import datetime
 import re
 from functools import partial
 from typing import Any
 import scrapy
+from scrapy import signals
 from scrapy.http import JsonRequest, Response
-from pdf2image import convert_from_bytes
-import pytesseract
 
+from price_scraper.backfill import BackfillCheckpoint, PendingReports, backfill_plan
+from price_scraper.business_days import business_days
 from price_scraper.items import PortfolioPerformanceHistoricalPrice
+from price_scraper.ocr import OcrCache, create_ocr_pool, ocr_options, pdf_to_pages, record_page_stats
+from price_scraper.price_exporter_pipeline import prices_committed
+from price_scraper.util import normalize_date
 
 
 class MakDailySpider(scrapy.Spider):
@@ -24,6 +29,7 @@ class MakDailySpider(scrapy.Spider):
     """
 
     name = "mak"
+    business_days_only = True
 
     def start_requests(self):
         yield scrapy.Request(
@@ -41,7 +47,9 @@ class MakDailySpider(scrapy.Spider):
             yield scrapy.Request(
                 url=f"https://www.allampapir.hu/api/network_rate///m/get_prices/{bond_type}",
                 method='POST',
-                callback=self.parse_type
+                callback=self.parse_type,
+                # prices do not change on non-trading days
+                meta={'skip_unchanged': True}
             )
 
 
@@ -106,6 +114,12 @@ class MakHistoricalSpider(scrapy.Spider):
     https://webkincstar.allamkincstar.gov.hu/report-service/report
     POST data: `{"clientCode":"all","reportName":"_20633_arfolyam_mak","language":"hu",
     "report_params":[{"name":"datum","value":"2023-01-02"}]}`
+
+    The date range is given by the `start_date` and `end_date` arguments (`YYYY-MM-DD`,
+    both default to today), only the settlement days of the range are requested. Reports
+    whose prices are on disk are recorded in a checkpoint, so an interrupted backfill
+    only requests the missing reports when restarted:
+    `scrapy crawl mak_historical -a base_dir=<dir> -a start_date=2022-01-01 -a end_date=2024-08-14`
     """
 
     name = "mak_historical"
@@ -125,50 +139,88 @@ class MakHistoricalSpider(scrapy.Spider):
     # regex which identifies the beginning of the lines inthe table
     line_matcher = re.compile(r"^((K|N)\d{4}\/)|(D\d{6})|(\d{4}\/)")
 
+    ocr_pool = None
+    ocr_cache = None
+    checkpoint = None
+    pending_reports = None
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.ocr_pool = create_ocr_pool(crawler.settings)
+        spider.ocr_options = ocr_options(crawler.settings)
+        crawler.signals.connect(spider.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(spider.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(spider.prices_committed, signal=prices_committed)
+        return spider
+
+    def spider_opened(self, spider):
+        """
+        Opens the OCR cache, the stats are not available when the spider is created
+        """
+        self.ocr_cache = OcrCache.from_settings(self.settings, self.crawler.stats)
+
+    def prices_committed(self):
+        """
+        Records the reports whose prices are on disk in the checkpoint
+        """
+        if self.checkpoint is not None:
+            self.checkpoint.commit()
+
+    def spider_closed(self, spider):
+        """
+        Stops the OCR worker processes
+        """
+        self.ocr_pool.shutdown(cancel_futures=True)
+        if self.checkpoint is not None:
+            self.checkpoint.close()
+
     def start_requests(self):
-        date_ranges = [
-            # start, end
-            # (datetime.date(2022, 1, 1), datetime.date(2022, 7, 1)),
-            # (datetime.date(2022, 7, 2), datetime.date(2023, 1, 1)),
-            # (datetime.date(2023, 1, 2), datetime.date(2023, 7, 1)),
-            # (datetime.date(2023, 7, 2), datetime.date(2024, 1, 1)),
-            # (datetime.date(2024, 1, 2), datetime.date(2024, 8, 14)),
-            (datetime.date(2025, 10, 15), datetime.date(2025, 10, 15)),
-        ]
-        # increment manually
-        date_range = date_ranges[0]
-        end_date = date_range[1]
-        start_date = date_range[0]
-
-        offset = datetime.timedelta(days=1)
-
-        while start_date <= end_date:
-            for report_name in self.report_names:
-                body = {
-                    "clientCode": "all",
-                    "reportName":  report_name,
-                    #"reportName":  self.report_names[1],
-                    "language": "hu",
-                    "report_params": [
-                        {
-                            "name": "datum",
-                            "value": start_date.strftime("%Y-%m-%d")
-                        }
-                    ]
-                }
-                url = "https://webkincstar.allamkincstar.gov.hu/report-service/report"
-                yield JsonRequest(url=url,
-                    callback=partial(self.parse, curr_date=start_date, report_name=report_name),
-                    data=body,
-                    headers={
-                        'Accept': '*/*'
+        today = datetime.date.today()
+        start_date = self.date_argument("start_date", today)
+        end_date = self.date_argument("end_date", today)
+        self.checkpoint = BackfillCheckpoint(self.settings.get("BACKFILL_CHECKPOINT_DIR"), self)
+        # a report is done when its prices passed the pipelines, the checkpoint
+        # is committed when the price exporter persisted them
+        self.pending_reports = PendingReports(self.checkpoint)
+        self.crawler.signals.connect(self.pending_reports.item_finished, signal=signals.item_scraped)
+        self.crawler.signals.connect(self.pending_reports.item_finished, signal=signals.item_dropped)
+        self.crawler.signals.connect(self.pending_reports.item_failed, signal=signals.item_error)
+        plan = backfill_plan(self, self.checkpoint, start_date, end_date,
+            self.report_names, self.settings.getint("BACKFILL_CHUNK_DAYS"), business_days)
+
+        for curr_date, report_name in plan:
+            body = {
+                "clientCode": "all",
+                "reportName":  report_name,
+                "language": "hu",
+                "report_params": [
+                    {
+                        "name": "datum",
+                        "value": curr_date.strftime("%Y-%m-%d")
                     }
-                )
+                ]
+            }
+            url = "https://webkincstar.allamkincstar.gov.hu/report-service/report"
+            yield JsonRequest(url=url,
+                callback=partial(self.parse, curr_date=curr_date, report_name=report_name),
+                data=body,
+                headers={
+                    'Accept': '*/*'
+                }
+            )
 
-            start_date = start_date + offset
+    def date_argument(self, name, default):
+        """
+        Returns the date of a `YYYY-MM-DD` spider argument or the default
+        """
+        value = getattr(self, name, None)
+        if not value:
+            return default
+        return datetime.date.fromisoformat(normalize_date(value))
 
 
-    def parse(self, response: Response, **kwargs: Any):
+    async def parse(self, response: Response, **kwargs: Any):
         """
         Parses daily quote prices for bonds from pdf
         """
@@ -178,17 +230,39 @@ class MakHistoricalSpider(scrapy.Spider):
             curr_date.strftime("%Y-%m-%d"),
             report_name
         )
-        for item in self.parse_pdf(curr_date, response.body):
+        texts = await self.pdf_texts(response.body)
+        for item in self.parse_texts(curr_date, texts):
+            self.pending_reports.item_started(response)
             yield item
+        self.pending_reports.parsed(response, curr_date, report_name)
 
-    def parse_pdf(self, curr_date, data):
+    async def pdf_texts(self, data):
+        """
+        Returns the page texts of the PDF from the OCR cache or from the process pool
+        """
+        key = None
+        if self.ocr_cache is not None:
+            key = self.ocr_cache.key(data, self.ocr_options)
+            texts = self.ocr_cache.get(key)
+            if texts is not None:
+                return texts
+        # the extraction runs in the process pool, so the reactor keeps downloading
+        loop = asyncio.get_running_loop()
+        pages = await loop.run_in_executor(self.ocr_pool, pdf_to_pages, data, self.ocr_options)
+        record_page_stats(self.crawler.stats, pages)
+        texts = [text for text, _, _ in pages]
+        if self.ocr_cache is not None:
+            self.ocr_cache.put(key, texts)
+        return texts
+
+    def parse_texts(self, curr_date, texts):
         """
-        Converts the given PDF to images and then to string
+        Parses the OCR text of the PDF pages
         """
-        images = convert_from_bytes(data)
-        for image in images:
-            text = pytesseract.image_to_string(image)
+        for text in texts:
             for line in text.splitlines():
+                # the text layer keeps the indentation of the table
+                line = line.strip()
                 if MakHistoricalSpider.line_matcher.search(line):
                     product = self.parse_data(curr_date, line)
                     if product is None:
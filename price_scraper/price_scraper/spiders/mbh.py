@@ -6,6 +6,7 @@ import scrapy
 
 from scrapy.http import JsonRequest, Response
 from price_scraper.items import PortfolioPerformanceHistoricalPrice
+from price_scraper.known_dates import is_known_date
 
 class MbhVPFSpider(scrapy.Spider):
     """
@@ -20,6 +21,7 @@ class MbhVPFSpider(scrapy.Spider):
     """
 
     name = "mbh_nyugdij"
+    business_days_only = True
     def start_requests(self):
         url = "https://webapi.mbhnyp.hu/publicapi/api/arfolyam/onyp/get_arfolyam"
         data = {
@@ -48,6 +50,8 @@ class MbhVPFSpider(scrapy.Spider):
             del day['ARF_NAP']
             for portfolio, price in day.items():
                 portfolio = MbhVPFSpider.convert_portfolio(portfolio)
+                if is_known_date(self, portfolio, date):
+                    continue
                 yield PortfolioPerformanceHistoricalPrice(
                         file_name=portfolio,
                         date=date,
@@ -10,7 +10,8 @@ from typing import Any
 import scrapy
 from scrapy.http import Response
 
-from price_scraper.items import PortfolioPerformanceHistoricalPrice
+from price_scraper.items import PortfolioPerformanceHistoricalPrice, price_series
+from price_scraper.watermark import watermark_start_date
 
 class OtpVPFSpider(scrapy.Spider):
     """
@@ -20,8 +21,13 @@ class OtpVPFSpider(scrapy.Spider):
     """
 
     name = "otp_nyugdij"
+    business_days_only = True
     start_urls = ["https://www.otpnyugdij.hu/api/arfolyam/aktualis"]
 
+    def start_requests(self):
+        for url in self.start_urls:
+            yield scrapy.Request(url, dont_filter=True, meta={'skip_not_modified': True})
+
     def parse(self, response: Response, **kwargs: Any):
         data = response.json()
         for day in data:
@@ -80,8 +86,10 @@ class OtpVPFHistoricalSpider(scrapy.Spider):
             "Dinamikus"
         ]
         for portfolio in portfolios:
+            start_date = watermark_start_date(self, datetime.date(2008, 1, 1), file_names=[portfolio])
+            start_date = start_date.strftime("%Y%m%d")
             # pylint: disable=line-too-long
-            url = f"https://www.otpnyugdij.hu/api/arfolyam/letoltes?portfolios={portfolio}&startDate=20080101&endDate={today}"
+            url = f"https://www.otpnyugdij.hu/api/arfolyam/letoltes?portfolios={portfolio}&startDate={start_date}&endDate={today}"
             yield scrapy.Request(url=url, callback=partial(self.parse, portfolio=portfolio))
 
     def parse(self, response: Response, **kwargs: Any):
@@ -92,6 +100,12 @@ class OtpVPFHistoricalSpider(scrapy.Spider):
         buffer = io.StringIO(response.text)
         reader = csv.reader(buffer, delimiter=';')
 
+        series = price_series(
+            file_name=portfolio,
+            security_name=f"OTP Önkéntes Nyugdíjpénztári {portfolio} Portfólió",
+            currency="HUF",
+            ticker_symbol=f"OTPNY_{portfolio[:5].upper()}"
+        )
         # headers not needed
         next(reader)
         next(reader)
@@ -101,11 +115,7 @@ class OtpVPFHistoricalSpider(scrapy.Spider):
             # this means we don't need to process this data is it is obselete
             if row[2] == 'Archivált':
                 continue
-            yield PortfolioPerformanceHistoricalPrice(
-                    file_name=portfolio,
-                    date=row[0].strip()[:-1].replace('.', '-').replace(' ', ''),
-                    price=float(row[1]),
-                    security_name=f"OTP Önkéntes Nyugdíjpénztári {portfolio} Portfólió",
-                    currency="HUF",
-                    ticker_symbol=f"OTPNY_{portfolio[:5].upper()}"
-                )
+            series['dates'].append(row[0].strip()[:-1].replace('.', '-').replace(' ', ''))
+            series['prices'].append(float(row[1]))
+        if series['dates']:
+            yield series
@@ -7,6 +7,7 @@ import scrapy
 from scrapy.http import Response
 
 from price_scraper.items import PortfolioPerformanceHistoricalPrice
+from price_scraper.known_dates import is_known_date
 
 class PannoniaVPFSpider(scrapy.Spider):
     """
@@ -16,6 +17,7 @@ class PannoniaVPFSpider(scrapy.Spider):
     """
 
     name = "pannonia_nyugdij"
+    business_days_only = True
 
     def start_requests(self):
         # pylint: disable=line-too-long
@@ -28,6 +30,8 @@ class PannoniaVPFSpider(scrapy.Spider):
             portfolio = elem['label']
             for day in elem['data']:
                 date = day['x'].split('T')[0]
+                if is_known_date(self, portfolio, date):
+                    continue
                 price = day['y']
                 yield PortfolioPerformanceHistoricalPrice(
                     file_name=portfolio,
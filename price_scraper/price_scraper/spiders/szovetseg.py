@@ -25,6 +25,10 @@ class SzovetsegPPFSpider(scrapy.Spider):
     name = "szovetseg_nyugdij"
     start_urls = ["https://szovetsegnyp.hu/arfolyam.xlsx"]
 
+    def start_requests(self):
+        for url in self.start_urls:
+            yield scrapy.Request(url, dont_filter=True, meta={'skip_not_modified': True})
+
     def parse(self, response: Response, **kwargs: Any):
         """
         Parses portfolios from the response which is a complete page.
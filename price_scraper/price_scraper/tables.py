@@ -0,0 +1,120 @@
+"""
+Extraction of HTML tables in a single pass over the lxml tree.
+
+Rows and cells are given as CSS selectors which are translated to compiled
+XPath expressions once, the cell texts are read from the lxml elements
+directly instead of creating a Selector per cell.
+
+Text modes of a cell:
+- "first": its first descendant text or None, like `cell.css('::text').get()`
+- "direct": its own text nodes, like `row.css('td::text').getall()` (flattened over the row)
+- "joined": every descendant text joined with spaces, like `' '.join(cell.css('::text').getall())`
+- None: the lxml element itself
+
+When a table needs several text modes, walk it once with `text=None` and read
+the texts of the elements with `cell_texts`.
+"""
+from functools import lru_cache
+
+from lxml import etree
+from parsel.csstranslator import HTMLTranslator
+
+_translator = HTMLTranslator()
+
+
+@lru_cache(maxsize=None)
+def _compile(css):
+    return etree.XPath(_translator.css_to_xpath(css))
+
+
+def _root(source):
+    """
+    Returns the lxml element of a Response, a Selector or an lxml element
+    """
+    selector = getattr(source, "selector", source)
+    return getattr(selector, "root", selector)
+
+
+def _first_text(cell):
+    return next(cell.itertext(), None)
+
+
+def _direct_texts(cell):
+    texts = [cell.text] if cell.text is not None else []
+    texts.extend(child.tail for child in cell if child.tail is not None)
+    return texts
+
+
+def _joined_text(cell):
+    return ' '.join(cell.itertext())
+
+
+def select(source, css):
+    """
+    Returns the lxml elements matched by the CSS selector within `source`
+    """
+    return _compile(css)(_root(source))
+
+
+def clean_cells(cells, strip=False, drop_empty=False):
+    """
+    `strip` trims whitespaces and removes \xa0 characters,
+    `drop_empty` removes the None, empty and \xa0 cells
+    """
+    if strip:
+        cells = [cell.strip().replace('\xa0', '') if cell is not None else cell for cell in cells]
+    if drop_empty:
+        cells = [cell for cell in cells if cell and cell != '\xa0']
+    return cells
+
+
+def cell_texts(cells, text="first", strip=False, drop_empty=False):
+    """
+    Returns the texts of the given lxml elements (see the text modes of the module)
+    """
+    if text == "first":
+        values = [_first_text(cell) for cell in cells]
+    elif text == "direct":
+        values = [value for cell in cells for value in _direct_texts(cell)]
+    elif text == "joined":
+        values = [_joined_text(cell) for cell in cells]
+    else:
+        raise ValueError(f"Unknown text mode: {text}")
+    return clean_cells(values, strip, drop_empty)
+
+
+def _row_values(row, cell_path, text, strip, drop_empty):
+    elements = cell_path(row)
+    if text is None:
+        return elements
+    return cell_texts(elements, text, strip, drop_empty)
+
+
+def table_rows(source, rows, cells="td", text="first", strip=False, drop_empty=False):
+    """
+    Returns the cells of every row matched by the `rows` CSS selector within
+    `source` as lists of texts (see the text modes of the module)
+    """
+    cell_path = _compile(cells)
+    return [
+        _row_values(row, cell_path, text, strip, drop_empty)
+        for row in select(source, rows)
+    ]
+
+
+def extract_table(source, rows, cells="td", header_cells=None, header_row=0,
+                  text="first", strip=False, drop_empty=False):
+    """
+    Returns the header and the rows after it of a table. The header is the
+    row at `header_row` and its cells are matched by `header_cells` which
+    defaults to `cells`. The header is None if there is no such row.
+    """
+    elements = select(source, rows)
+    if len(elements) <= header_row:
+        return None, []
+    header = _row_values(elements[header_row], _compile(header_cells or cells), text, strip, drop_empty)
+    cell_path = _compile(cells)
+    return header, [
+        _row_values(row, cell_path, text, strip, drop_empty)
+        for row in elements[header_row + 1:]
+    ]
@@ -1,40 +1,204 @@
+import datetime
+import hashlib
+import json
 import os
+import re
+import tempfile
+from pathlib import Path
 
+from scrapy.utils.project import data_path
 from unidecode import unidecode
 
-def truncate_utf8_chars(filename, count, ignore_newlines=True):
+# matches a `"date": "<value>"` member of an exported price
+DATE_MEMBER = re.compile(rb'"date"\s*:\s*"([^"]*)"')
+# a partially read date member is never longer than this
+DATE_MEMBER_MAX_LENGTH = 256
+# year, month and day separated by `-`, `.` or `/` with optional padding and time part
+DATE_PATTERN = re.compile(r'^\s*(\d{4})\s*[-./]\s*(\d{1,2})\s*[-./]\s*(\d{1,2})\.?(?:[T ].*)?$')
+
+def truncate_json_array(filename, block_size=4096):
     """
-    Truncates last `count` characters of a text file encoded in UTF-8.
-    :param filename: The path to the text file to read
-    :param count: Number of UTF-8 characters to remove from the end of the file
-    :param ignore_newlines: Set to true, if the newline character at the end of the file
-    should be ignored
+    Prepares an exported json array for appending by removing its closing bracket.
+    The file is read backwards in blocks and truncated right after its last
+    complete element, which also drops a half-written tail left behind by an
+    interrupted run. Returns True if the array has at least one element.
+    :param filename: The path to the json file
+    :param block_size: Number of bytes read at once
     """
     with open(filename, 'rb+') as f:
-        size = os.fstat(f.fileno()).st_size
-
-        offset = 1
-        chars = 0
-        while offset <= size:
-            f.seek(-offset, os.SEEK_END)
-            b = ord(f.read(1))
-
-            if ignore_newlines:
-                if b == 0x0D or b == 0x0A:
-                    offset += 1
-                    continue
-
-            if b & 0b10000000 == 0 or b & 0b11000000 == 0b11000000:
-                # This is the first byte of a UTF8 character
-                chars += 1
-                if chars == count:
-                    # When `count` number of characters have been found, move current position back
-                    # with one byte (to include the byte just checked) and truncate the file
-                    f.seek(-1, os.SEEK_CUR)
-                    f.truncate()
-                    return
-            offset += 1
+        position = os.fstat(f.fileno()).st_size
+        tail = b''
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            tail = f.read(read_size) + tail
+            # elements are flat objects so the last `}` closes the last complete one
+            element_end = tail.rfind(b'}')
+            if element_end != -1:
+                f.truncate(position + element_end + 1)
+                return True
+            array_start = tail.rfind(b'[')
+            if array_start != -1:
+                f.truncate(position + array_start + 1)
+                f.seek(0, os.SEEK_END)
+                f.write(b'\n')
+                return False
+        f.truncate(0)
+        f.write(b'[\n')
+        return False
+
+def complete_elements_end(f, block_size=4096):
+    """
+    Returns the offset right after the last complete element of an exported
+    json array or 0 if there is none. Anything after it is a half-written tail.
+    :param f: The json file opened in binary mode
+    :param block_size: Number of bytes read at once
+    """
+    position = os.fstat(f.fileno()).st_size
+    while position > 0:
+        read_size = min(block_size, position)
+        position -= read_size
+        f.seek(position)
+        # elements are flat objects so the last `}` closes the last complete one
+        element_end = f.read(read_size).rfind(b'}')
+        if element_end != -1:
+            return position + element_end + 1
+    return 0
+
+def read_stored_rows(filename):
+    """
+    Returns the complete elements of an exported price file.
+    A half-written tail is skipped, because it is dropped when the file is appended.
+    :param filename: The path to the price json file
+    """
+    with open(filename, 'rb') as f:
+        end = complete_elements_end(f)
+        f.seek(0)
+        content = f.read(end)
+    if not content:
+        return []
+    return json.loads(content + b']')
 
 def sanitize_file_name(name):
     """Normalizes file name for instruments"""
     return unidecode(name.lower().replace(' ', '_').replace('/', '_'))
+
+def output_directory_name(spider_name):
+    """Returns the name of the output directory of a spider"""
+    return "mak" if spider_name == "mak_historical" else spider_name
+
+def instruments_csv_path(base_dir, spider_name):
+    """Returns the path of the instrument csv of a spider"""
+    return Path(base_dir) / "instruments" / f"{output_directory_name(spider_name)}.csv"
+
+def normalize_date(value):
+    """
+    Converts the date representations used by the spiders into a `YYYY-MM-DD` string.
+    Raises ValueError for unsupported values.
+    """
+    if isinstance(value, datetime.datetime):
+        return value.date().isoformat()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    match = DATE_PATTERN.match(str(value))
+    if match is None:
+        raise ValueError(f"Unsupported date: {value!r}")
+    year, month, day = (int(part) for part in match.groups())
+    return datetime.date(year, month, day).isoformat()
+
+def iter_stored_dates(filename, chunk_size=1 << 16):
+    """
+    Yields the `date` values of an exported price file without parsing
+    the whole json document. A half-written tail is skipped, because it is
+    dropped when the file is appended.
+    :param filename: The path to the price json file
+    :param chunk_size: Number of bytes read at once
+    """
+    with open(filename, 'rb') as f:
+        remaining = complete_elements_end(f)
+        f.seek(0)
+        rest = b''
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            buffer = rest + chunk
+            end = 0
+            for match in DATE_MEMBER.finditer(buffer):
+                yield match.group(1).decode('utf-8')
+                end = match.end()
+            # keep only the tail which may contain a partially read member
+            rest = buffer[max(end, len(buffer) - DATE_MEMBER_MAX_LENGTH):]
+
+def last_stored_date(filename, block_size=4096):
+    """
+    Returns the last `date` value of an exported price file by reading it
+    backwards from its last complete element. Returns None if the file
+    contains no dates.
+    :param filename: The path to the price json file
+    :param block_size: Number of bytes read at once
+    """
+    with open(filename, 'rb') as f:
+        position = complete_elements_end(f, block_size)
+        buffer = b''
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            buffer = f.read(read_size) + buffer
+            last_match = None
+            for last_match in DATE_MEMBER.finditer(buffer):
+                pass
+            if last_match is not None:
+                return last_match.group(1).decode('utf-8')
+    return None
+
+def write_atomic(filename, chunks, fsync=False):
+    """
+    Writes the given chunks into a temporary file next to `filename` and
+    renames it over `filename`, so readers never see a partially written file.
+    :param filename: The path of the file to replace
+    :param chunks: Iterable of bytes to write
+    :param fsync: Set to true, if the data and the rename should be flushed to disk
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    try:
+        mode = os.stat(filename).st_mode & 0o777
+    except FileNotFoundError:
+        mode = 0o644
+    fd, tmp_name = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(filename)}.", suffix=".tmp")
+    try:
+        os.fchmod(fd, mode)
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_name, filename)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+    if fsync:
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+def directory_digest(directory):
+    """
+    Returns a short digest which identifies a directory by its absolute path
+    """
+    return hashlib.sha1(os.path.abspath(directory).encode("utf-8")).hexdigest()[:12]
+
+def spider_state_path(directory, spider, suffix):
+    """
+    Returns the path of a file in the `.scrapy/<directory>` data directory which keeps
+    state between runs. The name is specific to the spider and to its output
+    directory, so scraping into a new directory does not reuse the state of another one.
+    """
+    digest = directory_digest(getattr(spider, "base_dir", ""))
+    return Path(data_path(directory, createdir=True)) / f"{spider.name}-{digest}{suffix}"
@@ -0,0 +1,83 @@
+import datetime
+from pathlib import Path
+
+from .util import last_stored_date, normalize_date, output_directory_name, sanitize_file_name
+
+
+class Watermarks:
+    """
+    Last stored dates of the instruments of a source read from the end of
+    their price files in the output tree.
+    """
+
+    def __init__(self, base_dir, source):
+        self.directory = Path(base_dir) / source
+
+    def last_date(self, file_name):
+        """
+        Returns the last stored date of an instrument or None if it has no history
+        """
+        return self._read(self.directory / f"{sanitize_file_name(file_name)}.json")
+
+    def last_dates(self):
+        """
+        Returns the last stored date of every instrument of the source
+        """
+        dates = {}
+        for file_path in sorted(self.directory.glob("*.json")):
+            date = self._read(file_path)
+            if date is not None:
+                dates[file_path.stem] = date
+        return dates
+
+    def start_date(self, file_names=None, stale_days=30):
+        """
+        Returns the earliest last stored date of the given instruments or of
+        every instrument of the source. Instruments which are behind the newest
+        one by more than `stale_days` are ignored, so a discontinued portfolio
+        does not pin the window. Returns None if any of the given instruments
+        has no history.
+        """
+        if file_names is None:
+            dates = list(self.last_dates().values())
+        else:
+            dates = [self.last_date(file_name) for file_name in file_names]
+            if None in dates:
+                return None
+        if not dates:
+            return None
+        newest = max(dates)
+        return min(date for date in dates if (newest - date).days <= stale_days)
+
+    @staticmethod
+    def _read(file_path):
+        if not file_path.exists():
+            return None
+        date = last_stored_date(file_path)
+        if date is None:
+            return None
+        return datetime.date.fromisoformat(normalize_date(date))
+
+
+def watermark_start_date(spider, default, file_names=None):
+    """
+    Returns the first date a spider has to request.
+
+    The `start_date` spider argument (`YYYY-MM-DD`) takes precedence. Otherwise
+    the date is computed from the watermarks of the spider's output directory
+    minus `WATERMARK_OVERLAP_DAYS`, falling back to `default` when there is
+    no history or `WATERMARK_ENABLED` is off.
+    """
+    if getattr(spider, "start_date", None):
+        return datetime.date.fromisoformat(normalize_date(spider.start_date))
+    settings = spider.settings
+    if not settings.getbool("WATERMARK_ENABLED") or not getattr(spider, "base_dir", None):
+        return default
+    watermarks = Watermarks(spider.base_dir, output_directory_name(spider.name))
+    start_date = watermarks.start_date(file_names, settings.getint("WATERMARK_STALE_DAYS"))
+    if start_date is None:
+        spider.logger.info("No stored history, requesting from %s", default)
+        return default
+    start_date = start_date - datetime.timedelta(days=settings.getint("WATERMARK_OVERLAP_DAYS"))
+    spider.logger.info("Requesting from watermark %s", start_date)
+    return start_date
@@ -0,0 +1,162 @@
+"""
+Runs the JSF historical mode of the bamosz spider on saved pages.
+
+The fixtures are reduced copies of the pages the spider reads: the fund listing,
+a fund page with the historical data form and the partial response of the form.
+"""
+from pathlib import Path
+from urllib.parse import parse_qs
+
+import pytest
+from scrapy.http import FormRequest, HtmlResponse, Request, XmlResponse
+from scrapy.utils.test import get_crawler
+
+from price_scraper.items import PortfolioPerformanceHistoricalPrice, PortfolioPerformancePriceSeries
+from price_scraper.spiders.bamosz import BamoszSpider
+
+FIXTURES = Path(__file__).parent / "fixtures" / "bamosz"
+
+INSTRUMENT = {
+    'isin': 'HU0000702501',
+    'currency': 'HUF',
+    'security_name': 'OTP Maxima Alap',
+}
+
+NEXT_INSTRUMENT = {
+    'isin': 'HU0000705280',
+    'currency': 'HUF',
+    'security_name': 'Aegon Közép-Európai Részvény Alap',
+}
+
+
+def fixture_response(name, url, response_class=HtmlResponse, request=None):
+    return response_class(
+        url=url,
+        body=(FIXTURES / name).read_bytes(),
+        encoding='utf-8',
+        request=request or Request(url),
+    )
+
+
+def jsf_spider():
+    return BamoszSpider(scrape_historical_data=True, historical_mode='jsf')
+
+
+def test_parse_listing():
+    response = fixture_response('legfrissebb-adatok.html', 'https://www.bamosz.hu/legfrissebb-adatok')
+    results = list(jsf_spider().parse(response))
+
+    prices = [result for result in results if isinstance(result, PortfolioPerformanceHistoricalPrice)]
+    assert [(item['isin'], item['security_name'], item['date'], item['price']) for item in prices] == [
+        ('HU0000702501', 'OTP Maxima Alap', '2024-10-16', 3.181205),
+        ('HU0000705280', 'Aegon Közép-Európai Részvény Alap', '2024-10-15', 1.503372),
+    ]
+    requests = [result for result in results if isinstance(result, Request)]
+    assert [request.url for request in requests] == [
+        'https://www.bamosz.hu/alapoldal?isin=HU0000702501',
+        'https://www.bamosz.hu/alapoldal?isin=HU0000705280',
+    ]
+    assert [request.meta['cookiejar'] for request in requests] == ['HU0000702501', 'HU0000705280']
+
+
+def test_request_historical_data_jsf():
+    response = fixture_response('alapoldal.html', 'https://www.bamosz.hu/alapoldal?isin=HU0000702501')
+    requests = list(jsf_spider().request_historical_data_jsf(INSTRUMENT, response))
+
+    assert len(requests) == 1
+    request = requests[0]
+    assert isinstance(request, FormRequest)
+    assert request.method == 'POST'
+    assert request.url.startswith('https://www.bamosz.hu/web/guest/alapoldal?p_p_id=bamoszpublicalapoldal')
+    assert request.headers['Faces-Request'] == b'partial/ajax'
+    assert request.headers['X-Requested-With'] == b'XMLHttpRequest'
+    assert request.meta['cookiejar'] == 'HU0000702501'
+    form = parse_qs(request.body.decode())
+    assert form == {
+        'A3225:j_idt8': ['A3225:j_idt8'],
+        'A3225:j_idt8:startDate_input': ['2024.09.01'],
+        'A3225:j_idt8:endDate_input': ['2024.10.16'],
+        'javax.faces.ViewState': ['-4125487265341870631:2190432201453265813'],
+        'javax.faces.partial.ajax': ['true'],
+        'javax.faces.source': ['A3225:j_idt8:j_idt20'],
+        'javax.faces.partial.execute': ['@all'],
+        'javax.faces.partial.render': ['A3225:j_idt8'],
+        'A3225:j_idt8:j_idt20': ['A3225:j_idt8:j_idt20'],
+    }
+
+
+def test_request_historical_data_jsf_without_form():
+    response = fixture_response('legfrissebb-adatok.html', 'https://www.bamosz.hu/alapoldal?isin=HU0000702501')
+    assert not list(jsf_spider().request_historical_data_jsf(INSTRUMENT, response))
+
+
+def test_parse_partial_response():
+    response = fixture_response(
+        'partial-response.xml',
+        'https://www.bamosz.hu/web/guest/alapoldal',
+        response_class=XmlResponse,
+    )
+    results = list(jsf_spider().parse_partial_response(INSTRUMENT, response))
+
+    assert len(results) == 1
+    series = results[0]
+    assert isinstance(series, PortfolioPerformancePriceSeries)
+    assert series['isin'] == series['file_name'] == 'HU0000702501'
+    assert series['security_name'] == 'OTP Maxima Alap'
+    assert series['currency'] == 'HUF'
+    # the date without a price is skipped
+    assert series['dates'] == ['2024-09-02', '2024-09-04']
+    assert series['prices'] == [3.012345, 3.020001]
+
+
+def test_parse_partial_response_without_updates():
+    response = XmlResponse(
+        url='https://www.bamosz.hu/web/guest/alapoldal',
+        body=b'<partial-response id="j_id1"><changes></changes></partial-response>',
+    )
+    assert not list(jsf_spider().parse_partial_response(INSTRUMENT, response))
+
+
+def test_jsf_request_chain():
+    spider = jsf_spider()
+    page = fixture_response('alapoldal.html', 'https://www.bamosz.hu/alapoldal?isin=HU0000702501')
+    request = next(spider.request_historical_data_jsf(INSTRUMENT, page))
+    response = fixture_response('partial-response.xml', request.url, XmlResponse, request)
+
+    series = list(request.callback(response))
+    assert [item['dates'] for item in series] == [['2024-09-02', '2024-09-04']]
+
+
+def splash_session_spider():
+    crawler = get_crawler(BamoszSpider, {'BAMOSZ_SPLASH_SESSIONS': 1, 'SPLASH_URL': 'http://localhost:8050'})
+    spider = BamoszSpider.from_crawler(crawler, scrape_historical_data=True)
+    # the first fund page of the only session
+    next(spider.start_splash_sessions([INSTRUMENT, NEXT_INSTRUMENT]))
+    return spider
+
+
+def session_response(body):
+    url = 'https://www.bamosz.hu/web/guest/alapoldal'
+    return HtmlResponse(url=url, body=body, encoding='utf-8', request=Request(url, meta={'bamosz_session': 0}))
+
+
+def test_session_continues_without_table():
+    spider = splash_session_spider()
+    response = session_response(b'<html><body><p>Nincs adat</p></body></html>')
+
+    results = list(spider.parse_session_historical_data(INSTRUMENT, response))
+    assert [request.url for request in results] == ['https://www.bamosz.hu/alapoldal?isin=HU0000705280']
+    assert spider.crawler.stats.get_value('bamosz/historical_table_missing') == 1
+
+
+def test_session_continues_after_parse_error():
+    spider = splash_session_spider()
+    response = session_response(
+        b'<table class="dataTable2"><tr><th>Datum</th><th>Arfolyam</th></tr>'
+        b'<tr><td>2024.09.02.</td><td>n/a</td></tr></table>'
+    )
+
+    results = spider.parse_session_historical_data(INSTRUMENT, response)
+    assert next(results).url == 'https://www.bamosz.hu/alapoldal?isin=HU0000705280'
+    with pytest.raises(ValueError):
+        next(results)
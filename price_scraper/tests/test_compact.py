@@ -0,0 +1,25 @@
+"""
+Compacts a temporary output tree.
+"""
+import json
+
+from price_scraper.compact import compact_tree
+
+
+def test_compact_tree_skips_broken_files(tmp_path):
+    spider_dir = tmp_path / 'test'
+    spider_dir.mkdir()
+    (spider_dir / 'a.json').write_text('[\n{"price": 2, "date": "2024.01.02"},\n{"price": 1, "date": "2024-01-01"}\n]')
+    (spider_dir / 'b.json').write_text('[\n{"price": 1, "da')
+    (spider_dir / 'c.json').write_text('[\n{"price": 1, "date": "yesterday"}\n]')
+
+    result = compact_tree(tmp_path, workers=1)
+
+    assert result['files'] == 3
+    assert result['files_touched'] == 1
+    assert [file_path for file_path, _ in result['failed']] == [
+        str(spider_dir / 'b.json'),
+        str(spider_dir / 'c.json'),
+    ]
+    assert [row['date'] for row in json.loads((spider_dir / 'a.json').read_text())] == ['2024-01-01', '2024-01-02']
+    assert (spider_dir / 'b.json').read_text() == '[\n{"price": 1, "da'
@@ -0,0 +1,78 @@
+"""
+Runs the price exporter pipeline on a temporary output directory.
+"""
+import json
+import logging
+
+from scrapy.settings import Settings
+from scrapy.statscollectors import StatsCollector
+from scrapy.utils.test import get_crawler
+
+from price_scraper import settings as project_settings
+from price_scraper.items import PortfolioPerformanceHistoricalPrice
+from price_scraper.price_exporter_pipeline import PriceExporterPipeline
+
+
+class Spider:
+    name = 'test'
+    logger = logging.getLogger('test')
+
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+
+
+def price(name, date):
+    return PortfolioPerformanceHistoricalPrice(
+        file_name=name,
+        date=date,
+        price=1.5,
+        security_name=name,
+        currency='HUF',
+        ticker_symbol=name.upper(),
+    )
+
+
+def run_pipeline(base_dir, backend, dates):
+    settings = Settings()
+    settings.setmodule(project_settings)
+    settings.set('PRICE_STORAGE_BACKEND', backend)
+    settings.set('PRICE_STORAGE_SQLITE_PATH', str(base_dir / 'db' / 'prices.sqlite'))
+    pipeline = PriceExporterPipeline(settings)
+    spider = Spider(str(base_dir / 'output'))
+    pipeline.open_spider(spider)
+    for date in dates:
+        pipeline.process_item(price('Portfolio', date), spider)
+    pipeline.close_spider(spider)
+    with open(base_dir / 'output' / 'test' / 'portfolio.json', 'rb') as f:
+        return [row['date'] for row in json.load(f)]
+
+
+def test_sqlite_keeps_prices_of_the_json_backend(tmp_path):
+    assert run_pipeline(tmp_path, 'sqlite', ['2024-01-01']) == ['2024-01-01']
+    assert run_pipeline(tmp_path, 'json', ['2024-01-02']) == ['2024-01-01', '2024-01-02']
+    assert run_pipeline(tmp_path, 'sqlite', ['2024-01-03']) == ['2024-01-01', '2024-01-02', '2024-01-03']
+
+
+def test_sqlite_normalizes_imported_dates(tmp_path):
+    output = tmp_path / 'output' / 'test'
+    output.mkdir(parents=True)
+    (output / 'portfolio.json').write_text('[\n{"price": 1.5, "date": "2024.01.01."}\n]')
+
+    assert run_pipeline(tmp_path, 'sqlite', ['2024-01-01', '2024-01-02']) == ['2024-01-01', '2024-01-02']
+
+
+def test_storage_stats_are_published_on_close(tmp_path):
+    stats = StatsCollector(get_crawler())
+    settings = Settings()
+    settings.setmodule(project_settings)
+    settings.set('PRICE_EXPORTER_POOL_SIZE', 1)
+    pipeline = PriceExporterPipeline(settings, stats)
+    spider = Spider(str(tmp_path))
+    pipeline.open_spider(spider)
+    for name, date in [('A', '2024-01-01'), ('B', '2024-01-01'), ('A', '2024-01-02')]:
+        pipeline.process_item(price(name, date), spider)
+    assert stats.get_value('price_exporter/pool_misses') is None
+
+    pipeline.close_spider(spider)
+    assert stats.get_value('price_exporter/pool_misses') == 3
+    assert stats.get_value('price_exporter/pool_evictions') == 2